@@ -0,0 +1,44 @@
+from __future__ import print_function
+import sys
+import random
+import numpy as np
+from fictrac_vendomatic import FicTracVendomatic
+from fictrac_vendomatic import RandomFly
+from fictrac_vendomatic.batch_protocol import check_batch_protocol
+
+# Checks the vectorized BatchProtocol against the Protocol class, sample-for-sample, 
+# on random fly trajectories for a few parameter sets (exits with status 1 on any
+# mismatch). tests/test_batch_protocol.py runs the same check under pytest.
+
+num_fail = 0
+num_samples = 60000
+dt = 0.01
+
+param_list = [
+        {},
+        {'stim_threshold_window': 1.0, 'stim_threshold_distance': 1.0, 'protocol_reset_window': 2.0},
+        {'stim_pulse_on_window': 0.05, 'stim_pulse_off_window': 0.0},
+        {'stim_inner_radius': 0.3, 'stim_outer_radius': 0.6, 'protocol_reset_window': 0.5},
+        {'path_window': 3.0, 'path_buffer_size': 50},
+        ]
+
+for seed in range(3):
+    random.seed(seed)
+    fly = RandomFly(dt)
+    traj = {k: np.zeros((num_samples,)) for k in ('time', 'posx', 'posy', 'velx', 'vely', 'heading')}
+    traj['frame'] = np.arange(num_samples)
+    for i in range(num_samples):
+        fly.update()
+        traj['time'][i] = i*dt
+        traj['posx'][i] = fly.posx
+        traj['posy'][i] = fly.posy
+
+    for param_update in param_list:
+        param = dict(FicTracVendomatic.default_param)
+        param.update(param_update)
+        mismatch = check_batch_protocol(traj, param)
+        status = 'ok' if not any(mismatch.values()) else 'FAIL'
+        num_fail += status == 'FAIL'
+        print('seed={0}, {1}: {2} {3}'.format(seed, param_update, status, mismatch))
+
+sys.exit(1 if num_fail else 0)
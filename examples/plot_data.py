@@ -1,45 +1,74 @@
 from __future__ import print_function
 import sys
-import h5py
-import json
 import matplotlib.pyplot as plt
+from fictrac_vendomatic import LogReader
+from fictrac_vendomatic.overview import choose_overview_factor
+
+# Usage: python plot_data.py filename [t_start t_stop]
+#
+# Values are read lazily (only the time range and at most max_points rows of it) so
+# large log files can be plotted. If the log file has overview levels (see 
+# log-overview) the coarsest level which still gives at least points_per_pixel points
+# per pixel of the plot width is used and the min/max envelope and mean of each block 
+# are plotted.
+
+points_per_pixel = 2
 
 filename = sys.argv[1]
-h5file = h5py.File(filename, 'r')
+t_start = float(sys.argv[2]) if len(sys.argv) > 2 else None
+t_stop = float(sys.argv[3]) if len(sys.argv) > 3 else None
+
+reader = LogReader(filename)
 
 print()
 print('datasets')
 print('--------')
-for name in h5file:
-    print('  {0}, shape={1}, dtype={2}'.format(name,h5file[name].shape,h5file[name].dtype))
+for name in reader.keys:
+    dataset = reader.get_dataset(name)
+    print('  {0}, rows={1}, dtype={2}'.format(name,len(reader),dataset.dtype))
 print()
 
 print('attrs')
 print('-----')
-for k,v in h5file.attrs.iteritems():
-    if not k == 'jsonparam':
-        print('{0}: {1}'.format(k,v))
-    else:
-        print('{0}:'.format(k))
-        param = json.loads(v)
-        for kk,vv in param.iteritems():
-            print('  {0}: {1}'.format(kk,vv))
+for k,v in reader.attrs.items():
+    print('{0}: {1}'.format(k,v))
+param = reader.param
+if param is not None:
+    print('jsonparam:')
+    for kk,vv in param.items():
+        print('  {0}: {1}'.format(kk,vv))
 print()
 
+print('summary')
+print('-------')
+for k,v in reader.summary(t_start=t_start, t_stop=t_stop).items():
+    print('{0}: {1}'.format(k,v))
+print()
 
-plt.figure(1)
-plt.subplot(611)
-plt.plot(h5file['time'], h5file['posx'])
-plt.subplot(612)
-plt.plot(h5file['time'], h5file['posy'])
-plt.subplot(613)
-plt.plot(h5file['time'], h5file['velx'])
-plt.subplot(614)
-plt.plot(h5file['time'], h5file['vely'])
-plt.subplot(615)
-plt.plot(h5file['time'], h5file['pulse_on'])
-plt.subplot(616)
-plt.plot(h5file['time'], h5file['pulse_on_dt'])
-plt.show()
+fig = plt.figure(1)
+width = int(fig.get_figwidth()*fig.dpi)
+max_points = points_per_pixel*width
 
+rows = reader.time_slice(t_start, t_stop)
+keys = ['time', 'posx', 'posy', 'velx', 'vely', 'pulse_on', 'pulse_on_dt']
+factor = choose_overview_factor(reader.overview_factors, rows.stop - rows.start, max_points)
+print('rows: {0}, plot width: {1}px, overview level: {2}'.format(rows.stop - rows.start, width, factor))
+if factor == 1:
+    step = max(1, (rows.stop - rows.start)//max_points)
+    data = reader.read(keys, rows.start, rows.stop, step)
+    overview = None
+else:
+    overview = reader.read_overview(factor, keys, rows.start, rows.stop)
+reader.close()
 
+for i, key in enumerate(keys[1:]):
+    plt.subplot(611 + i)
+    if overview is None:
+        plt.plot(data['time'], data[key])
+    else:
+        t = overview['time']['mean']
+        plt.fill_between(t, overview[key]['min'], overview[key]['max'], alpha=0.3)
+        plt.plot(t, overview[key]['mean'])
+    plt.ylabel(key)
+plt.xlabel('time')
+plt.show()
@@ -5,6 +5,13 @@ from fictrac_vendomatic import degToRad
 param = { 
         'redis_channel' : 'fictrac',
         'loop_dt': 0.01,
+        'codec': 'json',
+        'num_channels': 1,
+        'publish_batch_size': 1,
+        'load_duration': 10.0,
+        'load_spin_dt': 0.001,
+        'status_mode': 'console',
+        'status_rate': 5.0,
         'fly': {
             'model': RandomFly,
             'param': {
@@ -6,7 +6,14 @@ param = {
         'display_xlim': (-20,20),
         'display_ylim': (-20,20),
         'path_color': 'b',
+        'display': 'inline',
+        'display_mode': 'basic',
+        'display_shm_size': 100000,
+        'display_rate': 20.0,
+        'control_timeout': 0.01,
+        'runtime': 'thread',
         'path_window' : 60.0*60.0*10.0,
+        'path_buffer_size': 60*60*10*100,
         'stim_inner_color': 'r',
         'stim_outer_color': 'g',
         'stim_inner_radius': 2.0,   
@@ -19,10 +26,28 @@ param = {
         'stim_pulse_off_window': 9.0,
         'protocol_reset_window': 15.0,
         'trigger_device_port': '/dev/ttyUSB0', 
+        'trigger_device_writer': None,
+        'trigger_device_reset_dt': 2.0,
         'logfile_name': 'data.hdf5',
         'logfile_auto_incr': True, 
         'logfile_auto_incr_format': '{0:06d}',
         'logfile_dt': 0.01,
+        'logfile_chunk_size': 1000,
+        'logfile_flush_dt': 1.0,
+        'logfile_compound': False,
+        'logfile_writer': None,
+        'logfile_queue_size': 10000,
+        'logfile_segment_dt': None,
+        'logfile_segment_rows': None,
+        'logfile_swmr': False,
+        'logfile_overview_factors': None,
+        'logfile_compression': None,
+        'logfile_compression_opts': None,
+        'logfile_shuffle': False,
+        'logfile_dtypes': None,
+        'log_latency': False,
+        'status_mode': 'console',
+        'status_rate': 5.0,
         }
 
 client = FicTracVendomatic(param=param)
@@ -0,0 +1,14 @@
+from __future__ import print_function
+import sys
+from fictrac_vendomatic.h5_logger import H5TailReader
+
+# Follows a log file written with logfile_swmr=True and prints a line for each block
+# of new rows. Stops when no new rows have been added for 10 seconds.
+
+filename = sys.argv[1]
+
+reader = H5TailReader(filename)
+for rows in reader.follow(poll_dt=0.5, timeout=10.0):
+    num = len(rows['time'])
+    print('{0} new rows, time = {1:1.3f}, pulse_on = {2}'.format(num, rows['time'][-1], rows['pulse_on'][-1]))
+reader.close()
@@ -1,8 +1,23 @@
 from .fictrac_vendomatic import FicTracVendomatic
 from .fake_fictrac import FakeFicTrac
 from .fake_fictrac import RandomFly
+from .batch_random_fly import BatchRandomFly
+from .replay import Replay
+from .replay import load_trajectory
+from .log_reader import LogReader
+from .overview import build_overview
+from .sweep import Sweep
+from .fake_trigger_device import FakeTriggerDevice
+from .multi_rig import MultiRig
 from .cmd_line_apps import vendomatic_app
 from .cmd_line_apps import fake_fictrac_app
+from .cmd_line_apps import replay_app
+from .cmd_line_apps import sweep_app
+from .cmd_line_apps import benchmark_app
+from .cmd_line_apps import fake_trigger_device_app
+from .cmd_line_apps import multi_rig_app
+from .cmd_line_apps import random_flies_app
+from .cmd_line_apps import log_overview_app
 from .utils import radToDeg
 from .utils import degToRad
 
@@ -1,13 +1,32 @@
 import numpy
 import matplotlib
 import matplotlib.pyplot as plt
+from .ring_buffer import RingBuffer
 
 PLT_REQUIRES_PAUSE = matplotlib.__version__ < '1.5.1'
 PLT_PAUSE = 0.0001
 
 class BasicDisplay(object):
 
-    def __init__(self, param):
+    """
+    Live display of the fly's path and the stimulus region.
+
+    display_mode 'basic' redraws the full path and recenters the view on the fly
+    every update. display_mode 'fast' keeps the refresh cost constant as the session
+    grows: the path history is decimated to (roughly) screen resolution, only the
+    parts of it within the current view are drawn, the view is only recentered when
+    the fly comes within margin of its edge and, in between, the figure is updated
+    by blitting the path and stimulus artists over a cached background.
+
+    By default the display creates its own figure. Alternatively it can draw into
+    an existing axes (ax), e.g. one of several in a figure (see multi_rig.py).
+
+    """
+
+    Circ_Num_Pts = 100
+    Default_Lod_Size = 100000
+
+    def __init__(self, param, ax=None):
 
 
         self.path_color = param['path_color']
@@ -20,20 +39,46 @@ class BasicDisplay(object):
         self.stim_outer_radius = param['stim_outer_radius']
 
         self.margin = 2.0
+        self.fast_mode = param.get('display_mode', 'basic') == 'fast'
+
+        # Unit circle used for drawing the stimulus region - computed once
+        s = numpy.linspace(0,1,self.Circ_Num_Pts)
+        self.circ_cos = numpy.cos(2.0*numpy.pi*s)
+        self.circ_sin = numpy.sin(2.0*numpy.pi*s)
+        self.circ_state = None
+
+        # Decimated path history for fast mode
+        lod_size = param.get('display_lod_size', self.Default_Lod_Size)
+        self.lod_buffer = RingBuffer(lod_size, ('time', 'posx', 'posy'))
+        self.lod_count = 0
+        self.lod_last = None
+        self.background = None
+
+        self.owns_fig = ax is None
+        if self.owns_fig:
+            plt.ion()
+            self.fig = plt.figure(1)
+            self.ax = plt.subplot(111) 
+        else:
+            self.fig = ax.figure
+            self.ax = ax
+
+        self.pos_line, = self.ax.plot([0,1], [0,1],self.path_color)
+        self.pos_dot, = self.ax.plot([0], [1], self.path_color+'o',markersize=3.0)
+        self.stim_inner_circ, = self.ax.plot([0,1], [0,1],self.stim_inner_color)
+        self.stim_outer_circ, = self.ax.plot([0,1], [0,1],self.stim_outer_color)
+        self.ax.axis('equal')
+        self.ax.grid(True)
+        self.ax.set_xlabel('x pos')
+        self.ax.set_ylabel('y pos')
+        self.ax.set_title(param.get('display_title', "FicTrac's Vend-O-matic "))
+
+        self.artist_list = [self.pos_line, self.pos_dot, self.stim_inner_circ, self.stim_outer_circ]
+        if self.fast_mode:
+            for artist in self.artist_list:
+                artist.set_animated(True)
+            self.fig.canvas.mpl_connect('draw_event', self.on_draw)
 
-        plt.ion()
-        self.fig = plt.figure(1)
-        self.ax = plt.subplot(111) 
-
-        self.pos_line, = plt.plot([0,1], [0,1],self.path_color)
-        self.pos_dot, = plt.plot([0], [1], self.path_color+'o',markersize=3.0)
-        self.stim_inner_circ, = plt.plot([0,1], [0,1],self.stim_inner_color)
-        self.stim_outer_circ, = plt.plot([0,1], [0,1],self.stim_outer_color)
-        plt.axis('equal')
-        plt.grid('on')
-        plt.xlabel('x pos')
-        plt.ylabel('y pos')
-        plt.title("FicTrac's Vend-O-matic ")
         self.reset()
 
         self.fig.canvas.flush_events()
@@ -41,6 +86,9 @@ class BasicDisplay(object):
             plt.pause(PLT_PAUSE)
 
     def update(self,data):
+        if self.fast_mode:
+            self.update_fast(data)
+            return
         self.draw_stim_circ()
         self.draw_path(data)
         self.set_xylim(data)
@@ -48,37 +96,125 @@ class BasicDisplay(object):
         if PLT_REQUIRES_PAUSE:
             plt.pause(PLT_PAUSE)
 
+    def update_fast(self,data):
+        self.draw_stim_circ()
+        limits_changed = self.set_xylim_lod(data)
+        self.draw_path_lod(data)
+        canvas = self.fig.canvas
+        if limits_changed or self.background is None or not canvas.supports_blit:
+            canvas.draw()
+        else:
+            canvas.restore_region(self.background)
+            self.draw_artists()
+            canvas.blit(self.ax.bbox)
+        canvas.flush_events()
+        if PLT_REQUIRES_PAUSE:
+            plt.pause(PLT_PAUSE)
+
+    def on_draw(self,event):
+        # Cache background (everything but the animated artists) after a full redraw
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for artist in self.artist_list:
+            self.ax.draw_artist(artist)
+
     def draw_path(self,data):
         self.pos_line.set_xdata(data.posx_list)
         self.pos_line.set_ydata(data.posy_list)
         self.pos_dot.set_xdata([data.posx])
         self.pos_dot.set_ydata([data.posy])
 
+    def draw_path_lod(self,data):
+        self.update_lod_buffer(data)
+        posx = numpy.append(self.lod_buffer.view('posx'), data.posx)
+        posy = numpy.append(self.lod_buffer.view('posy'), data.posy)
+
+        # Only keep points inside the view (and their neighbors so that segments
+        # crossing the edge are drawn), breaking the line with nans at gaps.
+        xmin, xmax = self.ax.get_xlim()
+        ymin, ymax = self.ax.get_ylim()
+        inside = (posx >= xmin) & (posx <= xmax) & (posy >= ymin) & (posy <= ymax)
+        keep = inside.copy()
+        keep[1:] |= inside[:-1]
+        keep[:-1] |= inside[1:]
+        ind = numpy.flatnonzero(keep)
+        gaps = numpy.flatnonzero(numpy.diff(ind) > 1) + 1
+        posx = numpy.insert(posx[ind], gaps, numpy.nan)
+        posy = numpy.insert(posy[ind], gaps, numpy.nan)
+
+        self.pos_line.set_xdata(posx)
+        self.pos_line.set_ydata(posy)
+        self.pos_dot.set_xdata([data.posx])
+        self.pos_dot.set_ydata([data.posy])
+
+    def update_lod_buffer(self,data):
+        """
+        Incrementally adds new samples to the decimated path history, keeping only
+        points which are at least one pixel (in data units) from the last kept point,
+        and removes points which are no longer in the data's path window.
+        """
+        if data.count < self.lod_count:
+            self.reset_lod()
+        num_new = min(data.count - self.lod_count, len(data.time_list))
+        self.lod_count = data.count
+        if num_new > 0:
+            tol = self.get_pixel_size()
+            time_list = data.time_list[-num_new:]
+            posx_list = data.posx_list[-num_new:]
+            posy_list = data.posy_list[-num_new:]
+            for t, x, y in zip(time_list.tolist(), posx_list.tolist(), posy_list.tolist()):
+                if self.lod_last is not None:
+                    if abs(x - self.lod_last[0]) < tol and abs(y - self.lod_last[1]) < tol:
+                        continue
+                self.lod_buffer.append(t, x, y)
+                self.lod_last = (x,y)
+        if len(data.time_list) > 0:
+            time_min = data.time_list[0]
+            while len(self.lod_buffer) > 0 and self.lod_buffer.first('time') < time_min:
+                self.lod_buffer.popleft()
+
+    def get_pixel_size(self):
+        width_pix = max(self.ax.get_window_extent().width, 1.0)
+        return (self.xlim_init[1] - self.xlim_init[0])/width_pix
+
     def set_xylim(self,data):
         self.xlim = data.posx + self.xlim_init[0], data.posx + self.xlim_init[1]
         self.ylim = data.posy + self.ylim_init[0], data.posy + self.ylim_init[1]
         self.ax.set_xlim(*self.xlim)
         self.ax.set_ylim(*self.ylim)
 
+    def set_xylim_lod(self,data):
+        """
+        Recenter the view on the fly only when it gets within margin of the edge of
+        the view. Returns True if the view limits were changed.
+        """
+        inside_x = self.xlim[0] + self.margin <= data.posx <= self.xlim[1] - self.margin
+        inside_y = self.ylim[0] + self.margin <= data.posy <= self.ylim[1] - self.margin
+        if inside_x and inside_y:
+            return False
+        self.set_xylim(data)
+        return True
+
     def draw_stim_circ(self):
+        circ_state = (self.stim_enabled, self.stim_x, self.stim_y)
+        if circ_state == self.circ_state:
+            return
+        self.circ_state = circ_state
         line_list = [self.stim_inner_circ, self.stim_outer_circ]
         if self.stim_enabled:
-            s = numpy.linspace(0,1,100)
             radius_list = [self.stim_inner_radius, self.stim_outer_radius]
             for radius, line in zip(radius_list, line_list):
-                circ_vals_x = radius*numpy.cos(2.0*numpy.pi*s) + self.stim_x
-                circ_vals_y = radius*numpy.sin(2.0*numpy.pi*s) + self.stim_y
-                minx = self.stim_x - radius
-                maxx = self.stim_x + radius
-                miny = self.stim_y - radius
-                maxy = self.stim_y + radius
+                circ_vals_x = radius*self.circ_cos + self.stim_x
+                circ_vals_y = radius*self.circ_sin + self.stim_y
                 line.set_xdata(circ_vals_x)
                 line.set_ydata(circ_vals_y)
         else:
             for line in line_list:
                 line.set_xdata([])
                 line.set_ydata([])
-            
+
     def set_stim_center(self,x,y):
         self.stim_x = x
         self.stim_y = y
@@ -86,11 +222,22 @@ class BasicDisplay(object):
     def set_stim_enabled(self,value):
         self.stim_enabled = value
 
+    def close(self):
+        if self.owns_fig:
+            plt.close(self.fig)
+
+    def reset_lod(self):
+        self.lod_buffer.clear()
+        self.lod_count = 0
+        self.lod_last = None
+
     def reset(self):
         self.is_first = True 
         self.stim_enabled = False
         self.stim_x = 0.0
         self.stim_y = 0.0
+        self.circ_state = None
+        self.reset_lod()
         self.xlim = self.xlim_init
         self.ylim = self.ylim_init
         self.pos_line.set_xdata([])
@@ -103,7 +250,8 @@ class BasicDisplay(object):
         self.stim_outer_circ.set_ydata([])
         self.ax.set_xlim(*self.xlim)
         self.ax.set_ylim(*self.ylim)
+        self.background = None
         self.fig.canvas.flush_events()
         if PLT_REQUIRES_PAUSE:
             plt.pause(PLT_PAUSE)
-    
+
@@ -0,0 +1,183 @@
+from __future__ import print_function
+
+import numpy
+
+from .fly_data import FlyData
+from .replay import Replay
+
+
+class BatchProtocol(object):
+
+    """
+    Vectorized (numpy) implementation of the Protocol state machine for offline
+    analysis of whole sessions. Given the time, posx and posy arrays of a trajectory
+    it computes the ready, active, pulse_on and stimulus center timelines - i.e. the
+    protocol state after each sample - without stepping through the samples one at a
+    time.
+
+    Rather than testing every sample, the computation scans for the events which
+    change the state: for each protocol episode (from start or reset) the ready and
+    activation samples are found by evaluating the ready conditions and the window
+    distances (via searchsorted) in bulk, pulses are found by jumping between samples
+    inside the inner circle subject to the pulse on/off windows, and the reset sample
+    from a running maximum of the time last inside the outer circle. The cost is
+    proportional to the session length plus the number of events.
+
+    The results match the Protocol class sample-for-sample (see check_batch_protocol).
+    As in Replay, a decrease in time is treated as a reset message.
+
+    """
+
+    Chunk_Size = 4096
+
+    def __init__(self, param):
+        self.param = param
+
+    def run(self, t, posx, posy):
+        t = numpy.asarray(t, dtype=numpy.float64)
+        posx = numpy.asarray(posx, dtype=numpy.float64)
+        posy = numpy.asarray(posy, dtype=numpy.float64)
+        num = len(t)
+        result = {
+                'time': t.copy(),
+                'ready': numpy.zeros((num,), dtype=numpy.int64),
+                'active': numpy.zeros((num,), dtype=numpy.int64),
+                'pulse_on': numpy.zeros((num,), dtype=numpy.int64),
+                'stimx': numpy.zeros((num,), dtype=numpy.float64),
+                'stimy': numpy.zeros((num,), dtype=numpy.float64),
+                }
+        # Split at time decreases (reset messages) and process each segment
+        bounds = [0] + list(numpy.flatnonzero(numpy.diff(t) < 0) + 1) + [num]
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if hi > lo:
+                self.run_segment(t[lo:hi], posx[lo:hi], posy[lo:hi], {k: v[lo:hi] for k, v in result.items()})
+        return result
+
+    def run_segment(self, t, x, y, result):
+        num = len(t)
+        param = self.param
+
+        # Path length as accumulated by FlyData.add (starts with the third sample)
+        seg_len = numpy.zeros((num,))
+        if num > 2:
+            seg_len[2:] = numpy.sqrt((x[2:] - x[1:-1])**2 + (y[2:] - y[1:-1])**2)
+        path_len = numpy.cumsum(seg_len)
+
+        # First sample in the FlyData path buffer (path_window and buffer size)
+        ind = numpy.arange(num)
+        buffer_size = param.get('path_buffer_size', FlyData.default_path_buffer_size)
+        buffer_start = numpy.searchsorted(t, t - param['path_window'], side='left')
+        buffer_start = numpy.maximum(buffer_start, ind - buffer_size + 1)
+
+        start = 0
+        while start < num:
+            time_start = t[start]
+
+            # Ready
+            def ready_test(lo, hi):
+                delay_test = (t[lo:hi] - time_start) > param['stim_startup_delay']
+                path_test = path_len[lo:hi] > param['stim_startup_path_length']
+                return delay_test & path_test
+            ready_ind = find_first(ready_test, start, num, self.Chunk_Size)
+            if ready_ind is None:
+                return
+
+            # Activation
+            def activation_test(lo, hi):
+                i = ind[lo:hi]
+                t_thresh = numpy.maximum(
+                        t[lo:hi] - param['stim_threshold_window'],
+                        time_start + param['stim_startup_delay']
+                        )
+                n = numpy.searchsorted(t, t_thresh, side='right') - 1
+                n = numpy.minimum(numpy.maximum(n, buffer_start[lo:hi]), i)
+                win_dist = numpy.sqrt((x[n] - x[i])**2 + (y[n] - y[i])**2)
+                win_dist[buffer_start[lo:hi] == i] = 0.0
+                return win_dist >= param['stim_threshold_distance']
+            active_ind = find_first(activation_test, ready_ind, num, self.Chunk_Size)
+            if active_ind is None:
+                result['ready'][ready_ind:] = 1
+                return
+            stim_x = x[active_ind]
+            stim_y = y[active_ind]
+
+            # Reset - first sample more than protocol_reset_window after the fly was
+            # last inside the outer circle
+            reset_ind = None
+            time_outer = 0.0
+            lo = active_ind
+            chunk_size = self.Chunk_Size
+            while lo < num:
+                hi = min(lo + chunk_size, num)
+                dist = numpy.sqrt((stim_x - x[lo:hi])**2 + (stim_y - y[lo:hi])**2)
+                inside = dist <= param['stim_outer_radius']
+                time_last = numpy.maximum.accumulate(numpy.where(inside, t[lo:hi], -numpy.inf))
+                time_last = numpy.maximum(time_last, time_outer)
+                reset_test = t[lo:hi] > time_last + param['protocol_reset_window']
+                test_ind = numpy.flatnonzero(reset_test)
+                if len(test_ind) > 0:
+                    reset_ind = lo + test_ind[0]
+                    break
+                time_outer = time_last[-1]
+                lo = hi
+                chunk_size *= 2
+            end = num if reset_ind is None else reset_ind
+
+            # Pulses - inside inner circle, subject to on/off windows
+            last = num - 1 if reset_ind is None else reset_ind
+            dist = numpy.sqrt((stim_x - x[active_ind:last+1])**2 + (stim_y - y[active_ind:last+1])**2)
+            inner_ind = active_ind + numpy.flatnonzero(dist <= param['stim_inner_radius'])
+            pulse_ind = active_ind
+            is_first_pulse = True
+            while True:
+                k = numpy.searchsorted(inner_ind, pulse_ind)
+                if k >= len(inner_ind):
+                    break
+                pulse_ind = inner_ind[k]
+                if not is_first_pulse:
+                    eligible_ind = numpy.searchsorted(t, time_pulse_on + param['stim_pulse_on_window']
+                            + param['stim_pulse_off_window'], side='left')
+                    if pulse_ind < eligible_ind:
+                        pulse_ind = eligible_ind
+                        continue
+                is_first_pulse = False
+                time_pulse_on = t[pulse_ind]
+                off_ind = numpy.searchsorted(t, time_pulse_on + param['stim_pulse_on_window'], side='right')
+                off_ind = max(off_ind, pulse_ind + 1)
+                result['pulse_on'][pulse_ind:min(off_ind, end)] = 1
+                pulse_ind = off_ind + 1
+
+            result['ready'][ready_ind:end] = 1
+            result['active'][active_ind:end] = 1
+            result['stimx'][active_ind:end] = stim_x
+            result['stimy'][active_ind:end] = stim_y
+            if reset_ind is None:
+                return
+            start = reset_ind + 1
+
+
+def find_first(test, start, stop, chunk_size):
+    """
+    Returns index of first sample in [start, stop) for which test is True (or None).
+    test(lo, hi) returns bool array for samples lo to hi. Samples are tested in chunks
+    of increasing size so the cost is proportional to the distance to the result.
+    """
+    lo = start
+    while lo < stop:
+        hi = min(lo + chunk_size, stop)
+        test_ind = numpy.flatnonzero(test(lo, hi))
+        if len(test_ind) > 0:
+            return lo + test_ind[0]
+        lo = hi
+        chunk_size *= 2
+    return None
+
+
+def check_batch_protocol(traj, param, keys=('ready', 'active', 'pulse_on', 'stimx', 'stimy')):
+    """
+    Runs traj through both the Protocol class (via Replay) and BatchProtocol and
+    returns dict of the number of mismatched samples for each key.
+    """
+    result_ref = Replay(param).run(traj)
+    result_batch = BatchProtocol(param).run(traj['time'], traj['posx'], traj['posy'])
+    return {k: int(numpy.sum(result_ref[k] != result_batch[k])) for k in keys}
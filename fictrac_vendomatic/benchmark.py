@@ -0,0 +1,354 @@
+from __future__ import print_function
+
+import os
+import json
+import time
+import random
+import tempfile
+
+import numpy
+
+from . import utils
+from .fake_fictrac import RandomFly
+from .fly_data import FlyData
+from .protocol import Protocol
+from .h5_logger import H5Logger
+from .codec import get_codec
+from .codec import MessageDecoder
+
+
+class Benchmark(object):
+
+    """
+    Micro-benchmarks for the per-frame hot path. Each benchmark is run for a range of
+    sizes (e.g. length of path history) and reports the cost per frame/operation so
+    that scaling with session length is visible. Trajectories come from a RandomFly
+    with a fixed seed so runs are deterministic.
+
+    Results can be saved as a baseline (json) and later runs compared against it.
+
+    The h5logger_compression benchmark logs the same trajectory with each of the 
+    Compression_Settings (H5Logger keyword arguments) and reports the write time per
+    row along with the file size per row and compression ratio.
+
+    """
+
+    Default_Seed = 0
+    Default_Dt = 0.01
+    Compression_Rows = 50000
+    Ack_Timeout = 1.0
+    Wrap_Count = 3
+    Compression_Settings = {
+            'none': {},
+            'compact': {'dtypes': 'compact'},
+            'gzip': {'compression': 'gzip'},
+            'gzip_shuffle': {'compression': 'gzip', 'shuffle': True},
+            'gzip_shuffle_compact': {'compression': 'gzip', 'shuffle': True, 'dtypes': 'compact'},
+            'lzf_shuffle': {'compression': 'lzf', 'shuffle': True},
+            'lzf_shuffle_compact': {'compression': 'lzf', 'shuffle': True, 'dtypes': 'compact'},
+            'blosc_shuffle': {'compression': 'blosc', 'shuffle': True},
+            'blosc_shuffle_compact': {'compression': 'blosc', 'shuffle': True, 'dtypes': 'compact'},
+            }
+
+    def __init__(self, param, quick=False, seed=Default_Seed):
+        self.param = dict(param)
+        self.quick = quick
+        self.seed = seed
+        self.results = {}
+        self.info = {}
+        self.bench_list = [
+                ('flydata_add', self.bench_flydata_add, [1000, 10000, 100000, 1000000]),
+                ('protocol_update', self.bench_protocol_update, [1.0, 5.0, 50.0, 500.0]),
+                ('window_distance', self.bench_window_distance, [1.0, 5.0, 50.0, 500.0]),
+                ('h5logger_add', self.bench_h5logger_add, [1000, 10000, 100000]),
+                ('display_update_basic', self.bench_display_update_basic, [1000, 10000, 100000]),
+                ('display_update_fast', self.bench_display_update_fast, [1000, 10000, 100000]),
+                ('decode_json', self.bench_decode_json, [1]),
+                ('decode_binary', self.bench_decode_binary, [1]),
+                ('trigger_write', self.bench_trigger_write, [115200, 1000000]),
+                ('trigger_round_trip', self.bench_trigger_round_trip, [115200, 1000000]),
+                ('h5logger_compression', self.bench_h5logger_compression, get_compression_names()),
+                ]
+
+    @property
+    def num_ops(self):
+        return 200 if self.quick else 2000
+
+    def get_trajectory(self, num):
+        """
+        Returns list of (t, message) for num frames of a seeded RandomFly.
+        """
+        random.seed(self.seed)
+        fly = RandomFly(self.Default_Dt)
+        traj = []
+        for i in range(num):
+            fly.update()
+            msg = {
+                    'type': 'data',
+                    'frame': i,
+                    'posx': fly.posx,
+                    'posy': fly.posy,
+                    'velx': fly.velx,
+                    'vely': fly.vely,
+                    'heading': utils.radToDeg(fly.angle),
+                    }
+            traj.append((i*self.Default_Dt, msg))
+        return traj
+
+    def get_fly_data(self, num_history, num_extra=0):
+        """
+        Returns FlyData prefilled with num_history frames and list of num_extra more
+        frames to add.
+        """
+        param = dict(self.param)
+        param['path_buffer_size'] = max(num_history + num_extra, 2)
+        param['path_window'] = (num_history + num_extra + 1)*self.Default_Dt
+        data = FlyData(param)
+        traj = self.get_trajectory(num_history + num_extra)
+        for t, msg in traj[:num_history]:
+            data.add(t, msg)
+        return data, traj[num_history:]
+
+    def bench_flydata_add(self, num_history):
+        """
+        Time per FlyData.add with a path buffer of num_history samples and a path 
+        window of half of it, so every add evicts a sample. The buffer is filled first
+        and the timed adds wrap around it Wrap_Count times (the trajectory is reused,
+        with increasing time). 
+        """
+        param = dict(self.param)
+        param['path_buffer_size'] = num_history
+        param['path_window'] = 0.5*num_history*self.Default_Dt
+        data = FlyData(param)
+        traj = self.get_trajectory(min(num_history, 10000))
+        msg_list = [msg for t, msg in traj]
+        num_timed = max(self.num_ops, self.Wrap_Count*num_history)
+        for i in range(num_history):
+            data.add(i*self.Default_Dt, msg_list[i%len(msg_list)])
+        time_begin = time.perf_counter()
+        for i in range(num_history, num_history + num_timed):
+            data.add(i*self.Default_Dt, msg_list[i%len(msg_list)])
+        return (time.perf_counter() - time_begin)/num_timed
+
+    def bench_protocol_update(self, window):
+        return self.run_protocol(window, lambda protocol, t, data: protocol.update(t, data))
+
+    def bench_window_distance(self, window):
+        return self.run_protocol(window, lambda protocol, t, data: protocol.get_window_distance(t, data))
+
+    def run_protocol(self, window, func):
+        num_history = int(2*window/self.Default_Dt)
+        data, traj = self.get_fly_data(num_history, self.num_ops)
+        param = dict(self.param)
+        param['stim_threshold_window'] = window
+        param['stim_startup_delay'] = 0.0
+        protocol = Protocol(param)
+        protocol.update(0.0, data)
+        total = 0.0
+        for t, msg in traj:
+            data.add(t, msg)
+            time_begin = time.perf_counter()
+            func(protocol, t, data)
+            total += time.perf_counter() - time_begin
+        return total/len(traj)
+
+    def bench_h5logger_add(self, num_rows):
+        data, traj = self.get_fly_data(0, 1)
+        protocol = Protocol(self.param)
+        log_data = protocol.get_log_data(0.0, data)
+        with tempfile.TemporaryDirectory() as dirname:
+            logger = H5Logger(
+                    filename = os.path.join(dirname, 'bench.hdf5'),
+                    chunk_size = self.param.get('logfile_chunk_size', H5Logger.Default_Chunk_Size),
+                    flush_dt = self.param.get('logfile_flush_dt', H5Logger.Default_Flush_Dt),
+                    compound = self.param.get('logfile_compound', False),
+                    )
+            time_begin = time.perf_counter()
+            for i in range(num_rows):
+                log_data['time'] = i*self.Default_Dt
+                log_data['frame'] = i
+                logger.add(log_data)
+            logger.reset()
+            return (time.perf_counter() - time_begin)/num_rows
+
+    def bench_h5logger_compression(self, name):
+        """
+        Time per row to log a trajectory with Compression_Settings[name]. The file size
+        per row and compression ratio (vs. 'none') are added to info.
+        """
+        num_rows = self.Compression_Rows//10 if self.quick else self.Compression_Rows
+        log_data_list = self.get_log_data_list(num_rows)
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'bench.hdf5')
+            logger = H5Logger(
+                    filename = filename,
+                    chunk_size = self.param.get('logfile_chunk_size', H5Logger.Default_Chunk_Size),
+                    flush_dt = self.param.get('logfile_flush_dt', H5Logger.Default_Flush_Dt),
+                    compound = self.param.get('logfile_compound', False),
+                    **self.Compression_Settings[name]
+                    )
+            time_begin = time.perf_counter()
+            for log_data in log_data_list:
+                logger.add(log_data)
+            logger.reset()
+            dt = (time.perf_counter() - time_begin)/num_rows
+            file_size = os.path.getsize(filename)
+        raw_size = sum([numpy.asarray(v).nbytes for v in log_data_list[0].values()])*num_rows
+        self.info['h5logger_compression[{0}]'.format(name)] = '{0:8.1f} B/row {1:6.2f}x'.format(
+                file_size/float(num_rows), raw_size/float(file_size))
+        return dt
+
+    def get_log_data_list(self, num_rows):
+        """
+        Returns list of the rows logged for num_rows frames of a seeded RandomFly.
+        """
+        data, traj = self.get_fly_data(0, num_rows)
+        param = dict(self.param)
+        param['stim_startup_delay'] = 0.0
+        protocol = Protocol(param)
+        log_data_list = []
+        for t, msg in traj:
+            data.add(t, msg)
+            protocol.update(t, data)
+            log_data_list.append(protocol.get_log_data(t, data))
+        return log_data_list
+
+    def bench_display_update_basic(self, num_history):
+        return self.run_display('basic', num_history)
+
+    def bench_display_update_fast(self, num_history):
+        return self.run_display('fast', num_history)
+
+    def run_display(self, mode, num_history):
+        import matplotlib.pyplot as plt
+        from .basic_display import BasicDisplay
+        plt.switch_backend('Agg')
+        num_frames = self.num_ops//20
+        data, traj = self.get_fly_data(num_history, num_frames*5)
+        param = dict(self.param)
+        param['display_mode'] = mode
+        display = BasicDisplay(param)
+        display.update(data)
+        total = 0.0
+        for i in range(num_frames):
+            for t, msg in traj[5*i:5*(i+1)]:
+                data.add(t, msg)
+            time_begin = time.perf_counter()
+            display.update(data)
+            if mode == 'basic':
+                display.fig.canvas.draw() # gui event loop would draw basic mode updates
+            total += time.perf_counter() - time_begin
+        display.close()
+        return total/num_frames
+
+    def bench_decode_json(self, num):
+        return self.run_decode('json')
+
+    def bench_decode_binary(self, num):
+        return self.run_decode('binary')
+
+    def run_decode(self, codec_name):
+        codec = get_codec(codec_name)
+        decoder = MessageDecoder()
+        payload_list = []
+        for t, msg in self.get_trajectory(self.num_ops):
+            payload = codec.encode(msg)
+            if not isinstance(payload, bytes):
+                payload = payload.encode()
+            payload_list.append(payload)
+        time_begin = time.perf_counter()
+        for payload in payload_list:
+            decoder.decode(payload)
+        return (time.perf_counter() - time_begin)/len(payload_list)
+
+    def bench_trigger_write(self, baudrate):
+        """
+        Time per set_high/set_low call of TriggerDevice with a FakeTriggerDevice 
+        emulating the firmware at baudrate.
+        """
+        from .trigger_device import TriggerDevice
+        with self.fake_trigger_device(baudrate) as fake_device:
+            device = TriggerDevice(fake_device.port_name, reset_sleep_dt=0.0)
+            time_begin = time.perf_counter()
+            for i in range(self.num_ops//2):
+                device.set_high()
+                device.set_low()
+            device.flush()
+            dt = (time.perf_counter() - time_begin)/(2*(self.num_ops//2))
+            device.close()
+        return dt
+
+    def bench_trigger_round_trip(self, baudrate):
+        """
+        Mean round trip time (command write to acknowledgement) of AsyncTriggerDevice
+        with a FakeTriggerDevice emulating the firmware at baudrate. Commands are 
+        sent one at a time, waiting at most Ack_Timeout for each acknowledgement.
+        """
+        from .trigger_device import AsyncTriggerDevice
+        num_lost = 0
+        with self.fake_trigger_device(baudrate) as fake_device:
+            device = AsyncTriggerDevice(fake_device.port_name, timeout=1.0, reset_sleep_dt=0.0)
+            for i in range(self.num_ops//10):
+                num_acked = device.num_acked
+                if device.is_high:
+                    device.set_low()
+                else:
+                    device.set_high()
+                time_deadline = time.perf_counter() + self.Ack_Timeout
+                while device.num_acked == num_acked:
+                    if time.perf_counter() > time_deadline:
+                        num_lost += 1
+                        break
+                    time.sleep(0.0001)
+            device.close()
+        if num_lost:
+            utils.flush_print('warning: {0} trigger acknowledgements not received'.format(num_lost))
+        return device.rtt_hist.mean
+
+    def fake_trigger_device(self, baudrate):
+        from .fake_trigger_device import FakeTriggerDevice
+        param = dict(FakeTriggerDevice.default_param)
+        param['baudrate'] = baudrate
+        return FakeTriggerDevice(param)
+
+    def run(self, name_list=None):
+        for name, func, size_list in self.bench_list:
+            if name_list and name not in name_list:
+                continue
+            for size in size_list:
+                if self.quick and len(size_list) > 1 and size == size_list[-1]:
+                    continue
+                key = '{0}[{1}]'.format(name, size)
+                self.results[key] = func(size)
+                utils.flush_print('{0:44s} {1:10.2f} us {2}'.format(key, 1.0e6*self.results[key], self.info.get(key, '')))
+        return self.results
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.results, f, indent=2, sort_keys=True)
+
+    def compare(self, filename):
+        """
+        Prints the results next to the baseline results in filename.
+        """
+        with open(filename, 'r') as f:
+            baseline = json.load(f)
+        utils.flush_print()
+        utils.flush_print('{0:44s} {1:>10s} {2:>10s} {3:>8s}'.format('benchmark', 'base (us)', 'now (us)', 'ratio'))
+        for key, value in self.results.items():
+            if key not in baseline:
+                continue
+            ratio = value/baseline[key]
+            utils.flush_print('{0:44s} {1:10.2f} {2:10.2f} {3:8.2f}'.format(key, 1.0e6*baseline[key], 1.0e6*value, ratio))
+
+
+def get_compression_names():
+    """
+    Returns names of the Benchmark.Compression_Settings available (blosc requires 
+    hdf5plugin).
+    """
+    try:
+        import hdf5plugin
+        return list(Benchmark.Compression_Settings)
+    except ImportError:
+        return [k for k, v in Benchmark.Compression_Settings.items() if v.get('compression') != 'blosc']
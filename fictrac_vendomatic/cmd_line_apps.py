@@ -1,8 +1,19 @@
 from __future__ import print_function
 import argparse
 import json
+import time
 from .fictrac_vendomatic import FicTracVendomatic
 from .fake_fictrac import FakeFicTrac
+from .fake_fictrac import RandomFly
+from .batch_random_fly import BatchRandomFly
+from .replay import replay_files
+from .sweep import Sweep
+from .sweep import write_table
+from .benchmark import Benchmark
+from .fake_trigger_device import FakeTriggerDevice
+from .multi_rig import MultiRig
+from .overview import build_overview
+from .overview import Default_Factors
 
 def vendomatic_app():
 
@@ -27,6 +38,11 @@ def fake_fictrac_app():
 
     parser = argparse.ArgumentParser(description='Fake Fictrac publisher for testing vendomatic')
     parser.add_argument('-c','--config', help='json configuration file')
+    parser.add_argument('-l','--load', action='store_true', help='load generator mode')
+    parser.add_argument('-r','--rate', type=float, help='frame rate (Hz) per channel, sets loop_dt')
+    parser.add_argument('-n','--num-channels', type=int, help='number of channels (load mode)')
+    parser.add_argument('-b','--batch-size', type=int, help='frames per channel per pipelined publish (load mode)')
+    parser.add_argument('-d','--duration', type=float, help='duration (s) of load run, 0 to run until ctl-c')
     
     args = parser.parse_args()
     
@@ -35,8 +51,166 @@ def fake_fictrac_app():
         with open(args.config,'r') as f:
             config_dict = json.load(f)
     
-    if config_dict is None:
-        faker = FakeFicTrac()
+    if not args.load and args.rate is None:
+        if config_dict is None:
+            faker = FakeFicTrac()
+        else:
+            faker = FakeFicTrac(param=config_dict)
+        faker.run()
+        return
+
+    param = dict(FakeFicTrac.default_param)
+    if config_dict is not None:
+        param.update(config_dict)
+    if args.rate is not None:
+        param['loop_dt'] = 1.0/args.rate
+    if args.num_channels is not None:
+        param['num_channels'] = args.num_channels
+    if args.batch_size is not None:
+        param['publish_batch_size'] = args.batch_size
+    if args.duration is not None:
+        param['load_duration'] = args.duration if args.duration > 0 else None
+    faker = FakeFicTrac(param=param)
+    if args.load:
+        faker.run_load()
     else:
-        faker = FakeFicTrac(param=config_dict)
-    faker.run()
+        faker.run()
+
+
+def replay_app():
+
+    parser = argparse.ArgumentParser(description='Replay recorded sessions through the vendomatic protocol')
+    parser.add_argument('files', nargs='+', help='H5Logger log files or FicTrac .dat files')
+    parser.add_argument('-c','--config', help='json configuration file')
+    parser.add_argument('-o','--output', help='output log file name (auto-incremented)')
+    parser.add_argument('-r','--ball-radius', type=float, default=1.0, help='ball radius for FicTrac .dat files')
+
+    args = parser.parse_args()
+
+    param = dict(FicTracVendomatic.default_param)
+    if args.config is not None:
+        with open(args.config,'r') as f:
+            param.update(json.load(f))
+
+    replay_files(args.files, param, output_filename=args.output, ball_radius=args.ball_radius)
+
+
+def sweep_app():
+
+    parser = argparse.ArgumentParser(description='Parameter sweep of the vendomatic protocol over recorded sessions')
+    parser.add_argument('files', nargs='+', help='H5Logger log files or FicTrac .dat files')
+    parser.add_argument('-g','--grid', required=True, help='json file with parameter grid (name -> list of values)')
+    parser.add_argument('-c','--config', help='json configuration file')
+    parser.add_argument('-o','--output', default='sweep.csv', help='output summary table (csv)')
+    parser.add_argument('--cache', default='sweep_cache.json', help='json file for caching results')
+    parser.add_argument('-j','--jobs', type=int, default=None, help='number of worker processes')
+    parser.add_argument('-r','--ball-radius', type=float, default=1.0, help='ball radius for FicTrac .dat files')
+
+    args = parser.parse_args()
+
+    param = dict(FicTracVendomatic.default_param)
+    if args.config is not None:
+        with open(args.config,'r') as f:
+            param.update(json.load(f))
+    with open(args.grid,'r') as f:
+        grid = json.load(f)
+
+    sweep = Sweep(param, grid, cache_filename=args.cache, max_workers=args.jobs, ball_radius=args.ball_radius)
+    table = sweep.run(args.files)
+    write_table(table, args.output)
+    print('summary written to {0}'.format(args.output))
+
+
+def benchmark_app():
+
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the vendomatic per-frame hot path')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default all)')
+    parser.add_argument('-c','--config', help='json configuration file')
+    parser.add_argument('-q','--quick', action='store_true', help='fewer iterations and smaller sizes')
+    parser.add_argument('-s','--save', help='save results as baseline json file')
+    parser.add_argument('--compare', help='compare results with baseline json file')
+
+    args = parser.parse_args()
+
+    param = dict(FicTracVendomatic.default_param)
+    if args.config is not None:
+        with open(args.config,'r') as f:
+            param.update(json.load(f))
+
+    bench = Benchmark(param, quick=args.quick)
+    bench.run(args.names)
+    if args.save is not None:
+        bench.save(args.save)
+    if args.compare is not None:
+        bench.compare(args.compare)
+
+
+def fake_trigger_device_app():
+
+    parser = argparse.ArgumentParser(description='Emulates the pulse_firmware trigger device on a pseudo-terminal')
+    parser.add_argument('-b','--baudrate', type=float, default=115200, help='emulated baud rate (0 for no delay)')
+    parser.add_argument('-p','--processing-dt', type=float, default=0.0, help='per command processing delay (s)')
+
+    args = parser.parse_args()
+
+    param = {'baudrate': args.baudrate, 'processing_dt': args.processing_dt}
+    fake_device = FakeTriggerDevice(param)
+    fake_device.start()
+    print('fake trigger device on {0} (ctl-c to quit)'.format(fake_device.port_name))
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    fake_device.stop()
+    print('{0} commands received'.format(fake_device.num_cmds))
+
+
+def multi_rig_app():
+
+    parser = argparse.ArgumentParser(description='Runs several vendomatic rigs from one supervisor')
+    parser.add_argument('config', help='json configuration file with list of rigs')
+
+    args = parser.parse_args()
+
+    with open(args.config,'r') as f:
+        param = json.load(f)
+
+    supervisor = MultiRig(param)
+    supervisor.run()
+
+
+def random_flies_app():
+
+    parser = argparse.ArgumentParser(description='Generates synthetic trajectories of many random flies')
+    parser.add_argument('output', help='output hdf5 file')
+    parser.add_argument('-n','--num-flies', type=int, default=100, help='number of flies')
+    parser.add_argument('-s','--num-steps', type=int, default=360000, help='number of steps per fly')
+    parser.add_argument('--dt', type=float, default=0.01, help='time step (s)')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    parser.add_argument('-c','--config', help='json file with RandomFly parameters')
+
+    args = parser.parse_args()
+
+    param = dict(RandomFly.default_param)
+    if args.config is not None:
+        with open(args.config,'r') as f:
+            param.update(json.load(f))
+
+    flies = BatchRandomFly(args.num_flies, args.dt, param=param, seed=args.seed)
+    flies.write_h5(args.output, args.num_steps)
+    print('{0} flies x {1} steps written to {2}'.format(args.num_flies, args.num_steps, args.output))
+
+
+def log_overview_app():
+
+    parser = argparse.ArgumentParser(description='Adds min/max/mean overview levels to log files')
+    parser.add_argument('files', nargs='+', help='log files')
+    parser.add_argument('-f','--factors', type=int, nargs='+', default=list(Default_Factors), help='block sizes of the levels')
+
+    args = parser.parse_args()
+
+    for filename in args.files:
+        time_start = time.time()
+        build_overview(filename, args.factors)
+        print('{0}: levels {1} added in {2:1.2f}s'.format(filename, args.factors, time.time() - time_start))
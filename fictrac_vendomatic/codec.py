@@ -0,0 +1,126 @@
+from __future__ import print_function
+import json
+import struct
+
+
+class JsonCodec(object):
+
+    """
+    Encodes/decodes messages as json strings. This is the default codec.
+    """
+
+    name = 'json'
+
+    def encode(self,msg):
+        return json.dumps(msg)
+
+    def decode(self,payload):
+        return json.loads(payload)
+
+
+class BinaryCodec(object):
+
+    """
+    Encodes/decodes messages using a fixed binary layout (little endian).
+
+    Every message starts with a header of magic bytes, a version and a message type
+    code. Data messages are followed by the frame number (int64) and posx, posy, velx,
+    vely, heading (float64) and, from version 2, the publish time t_publish (float64, 
+    nan if not set). Reset messages have no body. Version 1 messages can still be 
+    decoded.
+
+    """
+
+    name = 'binary'
+
+    Magic = b'FV'
+    Version = 2
+
+    TypeReset = 0
+    TypeData = 1
+
+    Header = struct.Struct('<2sBB')
+    Data = struct.Struct('<2sBBq6d')
+    Data_V1 = struct.Struct('<2sBBq5d')
+
+    def __init__(self):
+        self.reset_payload = self.Header.pack(self.Magic, self.Version, self.TypeReset)
+
+    def encode(self,msg):
+        if msg['type'] == 'data':
+            return self.Data.pack(
+                    self.Magic,
+                    self.Version,
+                    self.TypeData,
+                    msg['frame'],
+                    msg['posx'],
+                    msg['posy'],
+                    msg['velx'],
+                    msg['vely'],
+                    msg['heading'],
+                    msg.get('t_publish', float('nan')),
+                    )
+        elif msg['type'] == 'reset':
+            return self.reset_payload
+        else:
+            raise(ValueError('unknown message type {0}'.format(msg['type'])))
+
+    def decode(self,payload):
+        magic, version, msg_type = self.Header.unpack_from(payload)
+        if magic != self.Magic:
+            raise(ValueError('payload is not a binary message'))
+        if version not in (1, self.Version):
+            raise(ValueError('unsupported binary message version {0}'.format(version)))
+        if msg_type == self.TypeData:
+            if version == self.Version:
+                _, _, _, frame, posx, posy, velx, vely, heading, t_publish = self.Data.unpack(payload)
+            else:
+                _, _, _, frame, posx, posy, velx, vely, heading = self.Data_V1.unpack(payload)
+                t_publish = float('nan')
+            msg = {
+                    'type': 'data',
+                    'frame': frame,
+                    'posx': posx,
+                    'posy': posy,
+                    'velx': velx,
+                    'vely': vely,
+                    'heading': heading,
+                    }
+            if t_publish == t_publish:
+                msg['t_publish'] = t_publish
+            return msg
+        elif msg_type == self.TypeReset:
+            return {'type': 'reset'}
+        else:
+            raise(ValueError('unknown binary message type {0}'.format(msg_type)))
+
+
+codec_dict = {
+        JsonCodec.name: JsonCodec,
+        BinaryCodec.name: BinaryCodec,
+        }
+
+
+def get_codec(name):
+    try:
+        return codec_dict[name]()
+    except KeyError:
+        raise(ValueError('unknown codec {0}, must be one of {1}'.format(name, sorted(codec_dict))))
+
+
+class MessageDecoder(object):
+
+    """
+    Decodes messages from any of the codecs. The codec is selected per message from
+    the payload: binary messages start with BinaryCodec.Magic, anything else is
+    treated as json.
+    """
+
+    def __init__(self):
+        self.json_codec = JsonCodec()
+        self.binary_codec = BinaryCodec()
+
+    def decode(self,payload):
+        if isinstance(payload, bytes) and payload[:2] == BinaryCodec.Magic:
+            return self.binary_codec.decode(payload)
+        return self.json_codec.decode(payload)
@@ -0,0 +1,274 @@
+from __future__ import print_function
+
+import time
+import signal
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy
+
+from .fly_data import FlyData
+
+
+class SharedDisplay(object):
+
+    """
+    Display which, instead of drawing, publishes the fly's trajectory and the stimulus
+    state to a block of shared memory to be drawn by another process (see 
+    DisplayProcess and multi_rig.py). Has the same interface as the BasicDisplay: the 
+    controller calls set_stim_center, set_stim_enabled, update and reset as usual.
+
+    Shared memory layout (float64): a header (see the Hdr_ constants) followed by a
+    ring buffer of display_shm_size samples of (time, posx, posy, heading). Writes are
+    guarded by a sequence counter (odd while a write is in progress) so the reader can
+    detect and retry torn reads without any locking on the writer side.
+
+    A new shared memory block is created unless the name of an existing one is given
+    as shm_name. 
+
+    """
+
+    Default_Shm_Size = 100000
+
+    Hdr_Seq = 0
+    Hdr_Done = 1
+    Hdr_Reset = 2
+    Hdr_Count = 3
+    Hdr_Posx = 4
+    Hdr_Posy = 5
+    Hdr_Stim_Enabled = 6
+    Hdr_Stim_X = 7
+    Hdr_Stim_Y = 8
+    Hdr_Size = 9
+
+    Sample_Fields = ('time', 'posx', 'posy', 'heading')
+
+    def __init__(self, param, shm_name=None):
+        self.capacity = int(param.get('display_shm_size', self.Default_Shm_Size))
+        self.owns_shm = shm_name is None
+        if self.owns_shm:
+            num_vals = self.Hdr_Size + len(self.Sample_Fields)*self.capacity
+            self.shm = shared_memory.SharedMemory(create=True, size=8*num_vals)
+        else:
+            self.shm = shared_memory.SharedMemory(name=shm_name)
+        self.header, self.samples = shared_arrays(self.shm, self.capacity)
+        if self.owns_shm:
+            self.header[:] = 0.0
+
+        self.count = 0
+        self.stim_enabled = False
+        self.stim_x = 0.0
+        self.stim_y = 0.0
+
+    def set_stim_center(self,x,y):
+        self.stim_x = x
+        self.stim_y = y
+
+    def set_stim_enabled(self,value):
+        self.stim_enabled = value
+
+    def update(self,data):
+        num_new = min(data.count - self.count, len(data.time_list), self.capacity)
+        self.begin_write()
+        if num_new > 0:
+            ind = numpy.arange(data.count - num_new, data.count) % self.capacity
+            self.samples[ind,0] = data.time_list[-num_new:]
+            self.samples[ind,1] = data.posx_list[-num_new:]
+            self.samples[ind,2] = data.posy_list[-num_new:]
+            self.samples[ind,3] = data.heading_list[-num_new:]
+        self.count = data.count
+        self.header[self.Hdr_Count] = data.count
+        self.header[self.Hdr_Posx] = data.posx
+        self.header[self.Hdr_Posy] = data.posy
+        self.header[self.Hdr_Stim_Enabled] = self.stim_enabled
+        self.header[self.Hdr_Stim_X] = self.stim_x
+        self.header[self.Hdr_Stim_Y] = self.stim_y
+        self.end_write()
+
+    def reset(self):
+        self.count = 0
+        self.stim_enabled = False
+        self.stim_x = 0.0
+        self.stim_y = 0.0
+        self.begin_write()
+        self.header[self.Hdr_Reset] += 1
+        self.header[self.Hdr_Count] = 0
+        self.header[self.Hdr_Stim_Enabled] = 0
+        self.end_write()
+
+    def close(self):
+        self.header = None
+        self.samples = None
+        self.shm.close()
+        if self.owns_shm:
+            self.shm.unlink()
+
+    def begin_write(self):
+        self.header[self.Hdr_Seq] += 1
+
+    def end_write(self):
+        self.header[self.Hdr_Seq] += 1
+
+
+class DisplayProcess(SharedDisplay):
+
+    """
+    Runs the BasicDisplay in a separate process so that a slow or frozen gui can not
+    delay the control loop. The controller's updates are published to shared memory
+    (see SharedDisplay) which is read by the display process at its own rate.
+
+    """
+
+    Join_Timeout = 5.0
+
+    def __init__(self, param):
+        super(DisplayProcess,self).__init__(param)
+
+        # Prefer fork so that scripts without a __main__ guard are not re-run 
+        if 'fork' in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context('fork')
+        else:
+            ctx = multiprocessing.get_context('spawn')
+        self.process = ctx.Process(target=display_process_main, args=(self.shm.name, self.capacity, param))
+        self.process.daemon = True
+        self.process.start()
+
+    def close(self):
+        self.header[self.Hdr_Done] = 1
+        self.process.join(self.Join_Timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        super(DisplayProcess,self).close()
+
+
+def shared_arrays(shm, capacity):
+    """
+    Returns header and sample ring buffer arrays backed by the shared memory block.
+    """
+    hdr_size = SharedDisplay.Hdr_Size
+    num_fields = len(SharedDisplay.Sample_Fields)
+    buf = numpy.ndarray((hdr_size + num_fields*capacity,), dtype=numpy.float64, buffer=shm.buf)
+    header = buf[:hdr_size]
+    samples = buf[hdr_size:].reshape((capacity, num_fields))
+    return header, samples
+
+
+def read_shared_state(header, samples, count_read, capacity):
+    """
+    Consistent (seqlock) read of the header and of the samples added since count_read.
+    Returns a copy of the header and an array of new samples.
+    """
+    while True:
+        seq = header[SharedDisplay.Hdr_Seq]
+        if seq % 2:
+            time.sleep(0.0001)
+            continue
+        header_copy = header.copy()
+        count = int(header_copy[SharedDisplay.Hdr_Count])
+        if count < count_read:
+            count_read = 0
+        num_new = min(count - count_read, capacity)
+        ind = numpy.arange(count - num_new, count) % capacity
+        new_samples = samples[ind]
+        if header[SharedDisplay.Hdr_Seq] == seq:
+            return header_copy, new_samples
+
+
+class SharedDisplayReader(object):
+
+    """
+    Reader side of a SharedDisplay. Each call to read copies the new samples from 
+    shared memory into a FlyData (data) and the latest header into header_copy.
+    """
+
+    def __init__(self, shm_name, capacity, param):
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        self.header, self.samples = shared_arrays(self.shm, capacity)
+        self.data = FlyData(param)
+        self.header_copy = self.header.copy()
+        self.reset_count = 0
+        self.count_read = 0
+
+    @property
+    def done(self):
+        return bool(self.header[SharedDisplay.Hdr_Done])
+
+    @property
+    def count(self):
+        return int(self.header_copy[SharedDisplay.Hdr_Count])
+
+    @property
+    def stim_enabled(self):
+        return bool(self.header_copy[SharedDisplay.Hdr_Stim_Enabled])
+
+    @property
+    def stim_x(self):
+        return self.header_copy[SharedDisplay.Hdr_Stim_X]
+
+    @property
+    def stim_y(self):
+        return self.header_copy[SharedDisplay.Hdr_Stim_Y]
+
+    def read(self):
+        """
+        Reads new samples. Returns True if the writer was reset since the last read
+        (the data is then reset too). 
+        """
+        is_reset = False
+        header_copy, new_samples = read_shared_state(self.header, self.samples, self.count_read, self.capacity)
+        if header_copy[SharedDisplay.Hdr_Reset] != self.reset_count:
+            is_reset = True
+            self.reset_count = header_copy[SharedDisplay.Hdr_Reset]
+            self.count_read = 0
+            self.data.reset()
+            header_copy, new_samples = read_shared_state(self.header, self.samples, self.count_read, self.capacity)
+        count = int(header_copy[SharedDisplay.Hdr_Count])
+        for i, (t, posx, posy, heading) in enumerate(new_samples.tolist()):
+            sample = {
+                    'frame': count - len(new_samples) + i,
+                    'posx': posx,
+                    'posy': posy,
+                    'velx': 0.0,
+                    'vely': 0.0,
+                    'heading': heading,
+                    }
+            self.data.add(t, sample)
+        self.count_read = count
+        self.header_copy = header_copy
+        return is_reset
+
+    def update_display(self, display):
+        """
+        Reads new samples and updates display with them.
+        """
+        if self.read():
+            display.reset()
+        display.set_stim_center(self.stim_x, self.stim_y)
+        display.set_stim_enabled(self.stim_enabled)
+        if self.data.count > 0:
+            display.update(self.data)
+
+    def close(self):
+        self.header = None
+        self.samples = None
+        self.shm.close()
+
+
+def display_process_main(shm_name, capacity, param):
+    """
+    Entry point for the display process. Reads the shared state published by the
+    DisplayProcess and draws it with a BasicDisplay at display_rate.
+    """
+    from .basic_display import BasicDisplay
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # shutdown is requested via the header
+    reader = SharedDisplayReader(shm_name, capacity, param)
+    display = BasicDisplay(param)
+    display_dt = 1.0/param.get('display_rate', 20.0)
+
+    while not reader.done:
+        time_begin = time.time()
+        reader.update_display(display)
+        time.sleep(max(display_dt - (time.time() - time_begin), 0.001))
+
+    reader.close()
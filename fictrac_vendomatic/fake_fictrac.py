@@ -1,11 +1,14 @@
 from __future__ import print_function
 import redis
 import time
-import json
 import math
 import random
 from .utils import degToRad 
 from .utils import radToDeg
+from .utils import flush_print
+from .codec import get_codec
+from .latency import LatencyHistogram
+from .status_console import StatusConsole
 
 
 
@@ -55,9 +58,33 @@ class RandomFly(object):
 
 class FakeFicTrac:
 
+    """
+    Publishes messages from a simulated fly (RandomFly) on redis in place of FicTrac. 
+    Frames are published on a fixed schedule of absolute deadlines (every loop_dt) so 
+    the rate does not drift with the time spent per frame. The fly's state is shown
+    on a StatusConsole at status_rate. 
+
+    run_load is a load generator mode for stress testing FicTracVendomatic: no 
+    printing, num_channels simultaneous channels (redis_channel + channel number when
+    num_channels > 1), and frames are sent with redis pipelining - publish_batch_size
+    frames per channel per round trip, sent at the deadline of the last frame in the 
+    batch. Deadlines are met by sleeping until load_spin_dt before the deadline and 
+    then spinning. At the end a report of the achieved vs requested rate, of the 
+    lateness (jitter) of the start of the sends relative to their deadlines and of the
+    time taken by the sends is printed. 
+
+    """
+
     default_param = {
             'redis_channel' : 'fictrac',
             'loop_dt': 0.01,
+            'codec': 'json',
+            'num_channels': 1,
+            'publish_batch_size': 1,
+            'load_duration': 10.0,
+            'load_spin_dt': 0.001,
+            'status_mode': 'console',
+            'status_rate': 5.0,
             'fly': {
                 'model': RandomFly,
                 'param': {
@@ -72,11 +99,40 @@ class FakeFicTrac:
     def __init__(self,param=default_param):
         self.param = param
         self.redis_client = redis.StrictRedis()
+        self.codec = get_codec(self.param.get('codec', 'json'))
         self.frame = 0
 
-    def publish_msg(self,msg):
-        msg_json = json.dumps(msg)
-        self.redis_client.publish(self.param['redis_channel'], msg_json)
+    def publish_msg(self,msg,channel=None,client=None):
+        if msg['type'] == 'data':
+            msg['t_publish'] = time.time()
+        payload = self.codec.encode(msg)
+        if channel is None:
+            channel = self.param['redis_channel']
+        if client is None:
+            client = self.redis_client
+        client.publish(channel, payload)
+
+    @property
+    def channel_list(self):
+        num_channels = self.param.get('num_channels', 1)
+        if num_channels == 1:
+            return [self.param['redis_channel']]
+        return ['{0}{1}'.format(self.param['redis_channel'], i) for i in range(num_channels)]
+
+    def create_fly(self):
+        return self.param['fly']['model'](self.param['loop_dt'],self.param['fly']['param'])
+
+    @staticmethod
+    def get_data_msg(frame, fly):
+        return {
+                'type': 'data',
+                'frame': frame,
+                'posx': fly.posx,
+                'posy': fly.posy, 
+                'velx': fly.velx,
+                'vely': fly.vely,
+                'heading': radToDeg(fly.angle),
+                }
 
     @property
     def t_elapsed(self):
@@ -85,37 +141,124 @@ class FakeFicTrac:
     def run(self):
 
 
-        fly = self.param['fly']['model'](self.param['loop_dt'],self.param['fly']['param'])
+        fly = self.create_fly()
+        status_console = StatusConsole(self.param.get('status_mode', 'console'))
+        status_dt = 1.0/self.param.get('status_rate', StatusConsole.Default_Rate)
 
         msg = {'type': 'reset'}
         self.publish_msg(msg)
+        time_start = time.time()
+        time_status = time_start
 
         while True:
 
             fly.update()
 
-            print('frame:    {0}'.format(self.frame))
-            print('posx:     {0}'.format(fly.posx))
-            print('posy:     {0}'.format(fly.posy))
-            print('velx:     {0}'.format(fly.velx))
-            print('vely:     {0}'.format(fly.vely))
-            print('angle:    {0}'.format(radToDeg(fly.angle)))
-            print('speed:    {0}'.format(fly.speed))
-            print()
-
-            msg = {
-                    'type': 'data',
-                    'frame': self.frame,
-                    'posx': fly.posx,
-                    'posy': fly.posy, 
-                    'velx': fly.velx,
-                    'vely': fly.vely,
-                    'heading': radToDeg(fly.angle),
-                    }
-
+            if time.time() >= time_status:
+                status = [
+                        ('frame', self.frame),
+                        ('posx', fly.posx),
+                        ('posy', fly.posy),
+                        ('velx', fly.velx),
+                        ('vely', fly.vely),
+                        ('angle', radToDeg(fly.angle)),
+                        ('speed', fly.speed),
+                        ]
+                status_console.show(status)
+                time_status = max(time_status + status_dt, time.time())
+
+            msg = self.get_data_msg(self.frame, fly)
             self.publish_msg(msg)
-            time.sleep(self.param['loop_dt'])
             self.frame += 1
+            time_next = time_start + self.frame*self.param['loop_dt']
+            time.sleep(max(time_next - time.time(), 0.0))
+
+    def run_load(self, duration=None):
+        """
+        Load generator mode (see class docstring) - runs for duration seconds (default
+        load_duration, None to run until ctl-c) and returns the report dict.
+        """
+        if duration is None:
+            duration = self.param.get('load_duration', None)
+        loop_dt = self.param['loop_dt']
+        batch_size = max(int(self.param.get('publish_batch_size', 1)), 1)
+        spin_dt = self.param.get('load_spin_dt', 0.001)
+        channel_list = self.channel_list
+        fly_list = [self.create_fly() for channel in channel_list]
+        pipe = self.redis_client.pipeline(transaction=False)
+        late_hist = LatencyHistogram()
+        send_hist = LatencyHistogram()
+        num_late = 0
+        self.frame = 0
+
+        for channel in channel_list:
+            self.publish_msg({'type': 'reset'}, channel=channel)
+
+        time_start = time.perf_counter()
+        try:
+            while duration is None or self.frame*loop_dt < duration:
+                msg_list = []
+                for i in range(batch_size):
+                    for channel, fly in zip(channel_list, fly_list):
+                        fly.update()
+                        msg_list.append((channel, self.get_data_msg(self.frame, fly)))
+                    self.frame += 1
+                deadline = time_start + (self.frame - 1)*loop_dt
+                sleep_dt = deadline - time.perf_counter() - spin_dt
+                if sleep_dt > 0:
+                    time.sleep(sleep_dt)
+                while time.perf_counter() < deadline:
+                    pass
+                # Messages are encoded (and t_publish stamped) after the wait
+                time_send = time.perf_counter()
+                for channel, msg in msg_list:
+                    self.publish_msg(msg, channel=channel, client=pipe)
+                pipe.execute()
+                send_hist.add(time.perf_counter() - time_send)
+                late_hist.add(time_send - deadline)
+                if time_send - deadline > loop_dt:
+                    num_late += 1
+        except KeyboardInterrupt:
+            pass
+        # Elapsed time includes the period of the last frame 
+        time_elapsed = time.perf_counter() - time_start + loop_dt
+
+        report = {
+                'num_channels': len(channel_list),
+                'publish_batch_size': batch_size,
+                'num_frames': self.frame,
+                'time_elapsed': time_elapsed,
+                'requested_rate': 1.0/loop_dt,
+                'achieved_rate': self.frame/time_elapsed if time_elapsed > 0 else float('nan'),
+                'message_rate': len(channel_list)*self.frame/time_elapsed if time_elapsed > 0 else float('nan'),
+                'late_mean': late_hist.mean,
+                'late_p50': late_hist.percentile(50),
+                'late_p99': late_hist.percentile(99),
+                'late_max': late_hist.max,
+                'send_mean': send_hist.mean,
+                'send_max': send_hist.max,
+                'num_sends': late_hist.count,
+                'num_late': num_late,
+                }
+        status_console = StatusConsole(self.param.get('status_mode', 'console'))
+        print_load_report(report, status_console.message)
+        return report
+
+
+def print_load_report(report, print_func=flush_print):
+    print_func()
+    print_func('channels x batch size    = {0} x {1}'.format(report['num_channels'], report['publish_batch_size']))
+    print_func('frames per channel       = {0} in {1:1.3f} s'.format(report['num_frames'], report['time_elapsed']))
+    print_func('requested rate (Hz)      = {0:1.1f}'.format(report['requested_rate']))
+    print_func('achieved rate (Hz)       = {0:1.1f} ({1:1.1f}%)'.format(report['achieved_rate'], 
+        100.0*report['achieved_rate']/report['requested_rate']))
+    print_func('total messages (msg/s)   = {0:1.1f}'.format(report['message_rate']))
+    print_func('send lateness (ms)       = mean {0:1.3f}, p50 {1:1.3f}, p99 {2:1.3f}, max {3:1.3f}'.format(
+        1.0e3*report['late_mean'], 1.0e3*report['late_p50'], 1.0e3*report['late_p99'], 1.0e3*report['late_max']))
+    print_func('send duration (ms)       = mean {0:1.3f}, max {1:1.3f}'.format(
+        1.0e3*report['send_mean'], 1.0e3*report['send_max']))
+    print_func('sends later than loop_dt = {0} of {1}'.format(report['num_late'], report['num_sends']))
+    print_func()
 
 
 
@@ -127,6 +270,7 @@ if __name__ == '__main__':
     param = { 
             'redis_channel' : 'fictrac',
             'loop_dt': 0.01,
+            'codec': 'json',
             'fly': {
                 'model': RandomFly,
                 'param': {
@@ -0,0 +1,112 @@
+from __future__ import print_function
+import os
+import pty
+import tty
+import time
+import select
+import threading
+
+
+class FakeTriggerDevice(object):
+
+    """
+    Software stand-in for the pulse_firmware trigger device for testing and
+    benchmarking without hardware. Creates a pseudo-terminal - pass port_name to the
+    TriggerDevice - and emulates the firmware's serial protocol in a thread:
+    commands are received as "[cmd]" and, like the firmware, each is echoed (the
+    command number, \\r\\n terminated) as it is read, while "Trigger LOW" or "Trigger 
+    HIGH" is sent once per loop pass for the last command read in the pass. So 
+    commands which arrive together are coalesced into a single Trigger line.
+
+    The serial link is emulated by delaying each received and each sent byte by its
+    transmission time at baudrate (10 bits per byte). Set baudrate to None for no
+    delay. Each command also takes processing_dt seconds.
+
+    """
+
+    default_param = {
+            'baudrate': 115200,
+            'processing_dt': 0.0,
+            }
+
+    CmdSetTriggerLow = 0
+    CmdSetTriggerHigh = 1
+    Poll_Dt = 0.01
+
+    def __init__(self, param=default_param):
+        self.param = param
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd)
+        self.port_name = os.ttyname(self.slave_fd)
+        self.trigger_high = False
+        self.num_cmds = 0
+        self.done = False
+        self.thread = None
+
+    def byte_dt(self, num_bytes):
+        baudrate = self.param.get('baudrate', None)
+        if not baudrate:
+            return 0.0
+        return num_bytes*10.0/baudrate
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stop(self):
+        self.done = True
+        if self.thread is not None:
+            self.thread.join()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def run(self):
+        msg_buf = b''
+        while not self.done:
+            ready, _, _ = select.select([self.master_fd], [], [], self.Poll_Dt)
+            if not ready:
+                continue
+            data = os.read(self.master_fd, 1024)
+            time.sleep(self.byte_dt(len(data)))
+            msg_buf += data
+            # One firmware loop pass - all the commands available are read (and 
+            # echoed), the trigger is then set for the last one
+            cmd = None
+            while b']' in msg_buf:
+                msg, msg_buf = msg_buf.split(b']', 1)
+                cmd = self.process_msg(msg.split(b'[')[-1]) 
+            reply = None
+            if cmd == self.CmdSetTriggerLow:
+                self.trigger_high = False
+                reply = 'Trigger LOW\r\n'
+            elif cmd == self.CmdSetTriggerHigh:
+                self.trigger_high = True
+                reply = 'Trigger HIGH\r\n'
+            if reply is not None:
+                self.write_reply(reply)
+
+    def process_msg(self, msg):
+        """
+        Echoes command in msg and returns it (None if msg is not a command). 
+        """
+        try:
+            cmd = int(msg.split(b',')[0])
+        except ValueError:
+            return None
+        time.sleep(self.param.get('processing_dt', 0.0))
+        self.num_cmds += 1
+        self.write_reply('{0}\r\n'.format(cmd))
+        return cmd
+
+    def write_reply(self, reply):
+        reply = reply.encode()
+        time.sleep(self.byte_dt(len(reply)))
+        os.write(self.master_fd, reply)
@@ -3,18 +3,25 @@ from __future__ import print_function
 import sys
 import time
 import redis
-import json
 import threading
 import queue
+import asyncio
 import math
 import signal
 
 from . import utils
 from .fly_data import FlyData
 from .trigger_device import TriggerDevice
+from .trigger_device import AsyncTriggerDevice
 from .protocol import Protocol
 from .basic_display import BasicDisplay
+from .display_process import DisplayProcess
+from .display_process import SharedDisplay
 from .h5_logger import H5Logger
+from .h5_logger import AsyncH5Logger
+from .codec import MessageDecoder
+from .latency import LatencyStats
+from .status_console import StatusConsole
 
 
 class FicTracVendomatic(object):
@@ -40,7 +47,14 @@ class FicTracVendomatic(object):
             'display_xlim': (-20,20),
             'display_ylim': (-20,20),
             'path_color': 'b',
+            'display': 'inline',
+            'display_mode': 'basic',
+            'display_shm_size': 100000,
+            'display_rate': 20.0,
+            'control_timeout': 0.01,
+            'runtime': 'thread',
             'path_window' : 60.0*60.0*10.0,
+            'path_buffer_size': 60*60*10*100,
             'stim_inner_color': 'r',
             'stim_outer_color': 'g',
             'stim_inner_radius': 2.0,   
@@ -53,10 +67,28 @@ class FicTracVendomatic(object):
             'stim_pulse_off_window': 9.0,
             'protocol_reset_window': 15.0,
             'trigger_device_port': '/dev/ttyUSB0',
+            'trigger_device_writer': None,
+            'trigger_device_reset_dt': 2.0,
             'logfile_name': 'data.hdf5',
             'logfile_auto_incr': True, 
             'logfile_auto_incr_format': '{0:06d}',
             'logfile_dt': 0.01,
+            'logfile_chunk_size': 1000,
+            'logfile_flush_dt': 1.0,
+            'logfile_compound': False,
+            'logfile_writer': None,
+            'logfile_queue_size': 10000,
+            'logfile_segment_dt': None,
+            'logfile_segment_rows': None,
+            'logfile_swmr': False,
+            'logfile_overview_factors': None,
+            'logfile_compression': None,
+            'logfile_compression_opts': None,
+            'logfile_shuffle': False,
+            'logfile_dtypes': None,
+            'log_latency': False,
+            'status_mode': 'console',
+            'status_rate': 5.0,
             }
 
 
@@ -64,35 +96,106 @@ class FicTracVendomatic(object):
 
         self.param = param
         self.data = FlyData(self.param)
-        self.display = BasicDisplay(self.param)
+        display_type = self.param.get('display', 'inline')
+        if display_type == 'inline':
+            self.display = BasicDisplay(self.param)
+        elif display_type == 'process':
+            self.display = DisplayProcess(self.param)
+        elif display_type == 'shared':
+            self.display = SharedDisplay(self.param, shm_name=self.param['display_shm_name'])
+        elif display_type == 'none':
+            self.display = None
+        else:
+            raise(ValueError('unknown display {0}, must be inline, process, shared or none'.format(display_type)))
         self.protocol = Protocol(self.param)
-        self.logger = H5Logger(
+        logger_kwargs = dict(
                 filename = self.param['logfile_name'],
                 auto_incr = self.param['logfile_auto_incr'],
                 auto_incr_format = self.param['logfile_auto_incr_format'],
-                param_attr = self.param
+                param_attr = self.param,
+                chunk_size = self.param.get('logfile_chunk_size', H5Logger.Default_Chunk_Size),
+                flush_dt = self.param.get('logfile_flush_dt', H5Logger.Default_Flush_Dt),
+                compound = self.param.get('logfile_compound', False),
+                segment_dt = self.param.get('logfile_segment_dt', None),
+                segment_rows = self.param.get('logfile_segment_rows', None),
+                prealloc_rows = self.get_logfile_prealloc_rows(),
+                swmr = self.param.get('logfile_swmr', False),
+                overview_factors = self.param.get('logfile_overview_factors', None),
+                compression = self.param.get('logfile_compression', None),
+                compression_opts = self.param.get('logfile_compression_opts', None),
+                shuffle = self.param.get('logfile_shuffle', False),
+                dtypes = self.param.get('logfile_dtypes', None),
                 )
+        logfile_writer = self.param.get('logfile_writer', None)
+        if logfile_writer is None:
+            self.logger = H5Logger(**logger_kwargs)
+        else:
+            self.logger = AsyncH5Logger(
+                    writer = logfile_writer, 
+                    queue_size = self.param.get('logfile_queue_size', AsyncH5Logger.Default_Queue_Size),
+                    **logger_kwargs
+                    )
         self.reset()
 
-        self.trigger_device = TriggerDevice(self.param['trigger_device_port'])
+        # Per frame latency instrumentation
+        self.latency = None
+        if self.param.get('log_latency', False):
+            self.latency = LatencyStats()
+        self.frame_stamps = {name: float('nan') for name in LatencyStats.Stamp_Names}
+        self.logger_error_reported = False
+
+        trigger_device_writer = self.param.get('trigger_device_writer', None)
+        trigger_device_reset_dt = self.param.get('trigger_device_reset_dt', TriggerDevice.ResetSleepDt)
+        if trigger_device_writer is None:
+            self.trigger_device = TriggerDevice(
+                    self.param['trigger_device_port'], 
+                    reset_sleep_dt=trigger_device_reset_dt
+                    )
+        elif trigger_device_writer == 'thread':
+            self.trigger_device = AsyncTriggerDevice(
+                    self.param['trigger_device_port'],
+                    reset_sleep_dt=trigger_device_reset_dt
+                    )
+        else:
+            raise(ValueError('unknown trigger_device_writer {0}, must be None or thread'.format(trigger_device_writer)))
         self.trigger_device.set_low()
 
-        # Setup message queue, redis and worker thread
-        self.message_queue = queue.Queue()
-        self.redis_client = redis.StrictRedis()
-        self.redis_pubsub = self.redis_client.pubsub()
-        self.redis_pubsub.subscribe(self.param['redis_channel'])
-        self.redis_worker = threading.Thread(target=self.message_reciever)
-        self.redis_worker.daemon = True
-        self.redis_worker.start()
+        # Setup message queue, redis and worker thread. For the asyncio runtime the 
+        # redis subscription is created in run_async. 
+        self.message_decoder = MessageDecoder()
+        self.status_console = StatusConsole(self.param.get('status_mode', 'console'))
+        self.runtime = self.param.get('runtime', 'thread')
+        if self.runtime == 'thread':
+            self.message_queue = queue.Queue()
+            self.redis_client = redis.StrictRedis()
+            self.redis_pubsub = self.redis_client.pubsub()
+            self.redis_pubsub.subscribe(self.param['redis_channel'])
+            self.redis_worker = threading.Thread(target=self.message_reciever)
+            self.redis_worker.daemon = True
+            self.redis_worker.start()
+        elif self.runtime != 'asyncio':
+            raise(ValueError('unknown runtime {0}, must be thread or asyncio'.format(self.runtime)))
 
         self.done = False
         signal.signal(signal.SIGINT,self.sigint_handler)
 
+    def get_logfile_prealloc_rows(self):
+        """
+        Expected number of rows in a log file segment - at most one row per logfile_dt.
+        """
+        segment_dt = self.param.get('logfile_segment_dt', None)
+        segment_rows = self.param.get('logfile_segment_rows', None)
+        if segment_rows:
+            return segment_rows
+        if segment_dt:
+            return int(math.ceil(segment_dt/self.param['logfile_dt']))
+        return None
+
     def reset(self):
         self.data.reset()
         self.protocol.reset()
-        self.display.reset()
+        if self.display is not None:
+            self.display.reset()
         self.time_start = time.time()
         self.time_now = self.time_start 
         self.time_log = None 
@@ -102,50 +205,183 @@ class FicTracVendomatic(object):
         return self.time_now - self.time_start
 
     def run(self):
+        if self.runtime == 'asyncio':
+            asyncio.run(self.run_async())
+        else:
+            self.run_threaded()
 
-        while not self.done:
-
-            # Pull latest redis message from queue
-            while self.message_queue.qsize() > 0:
-
-                self.time_now = time.time()
-                have_new_message = False 
-                message = ''
-
+    def run_threaded(self):
+        """
+        Main loop. The control path blocks on the message queue (with a timeout so that 
+        time based protocol transitions, e.g. pulse off, still happen when no messages 
+        arrive) and the display is refreshed at a fixed rate (display_rate) independent 
+        of the message rate. The status console is updated at status_rate.
+        """
+        display_dt = 1.0/self.param.get('display_rate', 20.0)
+        status_dt = 1.0/self.param.get('status_rate', StatusConsole.Default_Rate)
+        control_timeout = self.param.get('control_timeout', 0.01)
+        time_display = time.time()
+        time_status = time_display
+        self.display_count = 0
+        self.display_dt_max = 0.0
+
+        try:
+            while not self.done:
+
+                # Wait for next redis message, but no longer than next display refresh 
+                timeout = min(control_timeout, max(time_display - time.time(), 0.0))
                 try:
-                    message = self.message_queue.get(False)
-                    have_new_message = True
+                    message = self.message_queue.get(timeout=timeout)
                 except queue.Empty: 
-                    pass 
+                    message = None
 
-                if have_new_message: 
-                    self.message_switchyard(message)
+                self.control_update(message)
 
-                self.protocol.update(self.time_elapsed, self.data)
-
-                if self.protocol.pulse_on:
-                    self.trigger_device.set_high()
-                else:
-                    self.trigger_device.set_low()
+                # Update display at fixed rate 
+                if self.time_now >= time_display:
+                    self.update_display()
+                    time_display = max(time_display + display_dt, time.time())
 
-                self.write_logfile()
+                # Update status at fixed rate
+                if self.time_now >= time_status:
+                    self.update_status()
+                    time_status = max(time_status + status_dt, time.time())
+        finally:
+            # Always release the trigger device, also when the loop raises
+            self.done = True
+            self.run_finished()
 
-            # Update display
-            if self.protocol.active: 
-                self.display.set_stim_center(self.protocol.stim_x, self.protocol.stim_y) 
-                self.display.set_stim_enabled(True)
+    async def run_async(self):
+        """
+        asyncio version of the main loop. The redis subscription, control updates 
+        (protocol, trigger and logging), display refresh and periodic logfile flushes 
+        all run as coroutines on one event loop - there is no receiver thread or 
+        message queue. Several clients (e.g. on different redis channels) can be run
+        in one process with run_async_clients. 
+        """
+        import redis.asyncio
+        self.display_count = 0
+        self.display_dt_max = 0.0
+        redis_client = redis.asyncio.StrictRedis()
+        redis_pubsub = redis_client.pubsub()
+        await redis_pubsub.subscribe(self.param['redis_channel'])
+        try:
+            await asyncio.gather(
+                    self.control_task(redis_pubsub), 
+                    self.display_task(), 
+                    self.status_task(), 
+                    self.logfile_flush_task(),
+                    )
+        finally:
+            # Always release the trigger device, also when a task raises
+            self.done = True
+            try:
+                await redis_pubsub.unsubscribe()
+                await redis_pubsub.aclose()
+                await redis_client.aclose()
+            finally:
+                self.run_finished()
+
+    async def control_task(self,redis_pubsub):
+        control_timeout = self.param.get('control_timeout', 0.01)
+        while not self.done:
+            item = await redis_pubsub.get_message(ignore_subscribe_messages=True, timeout=control_timeout)
+            if item is None:
+                self.control_update(None)
             else:
-                self.display.set_stim_enabled(False)
+                t_receive = time.time()
+                message = self.message_decoder.decode(item['data'])
+                message['t_receive'] = t_receive
+                self.control_update(message)
+
+    async def display_task(self):
+        display_dt = 1.0/self.param.get('display_rate', 20.0)
+        while not self.done:
+            self.update_display()
+            await asyncio.sleep(display_dt)
 
-            self.display.update(self.data)
+    async def status_task(self):
+        status_dt = 1.0/self.param.get('status_rate', StatusConsole.Default_Rate)
+        while not self.done:
+            self.update_status()
+            await asyncio.sleep(status_dt)
 
+    async def logfile_flush_task(self):
+        flush_dt = self.param.get('logfile_flush_dt', H5Logger.Default_Flush_Dt) or H5Logger.Default_Flush_Dt
+        while not self.done:
+            await asyncio.sleep(flush_dt)
+            if getattr(self.logger, 'error', None) is None:
+                try:
+                    self.logger.flush()
+                except RuntimeError:
+                    pass # async writer failed - reported by check_logger
+            self.check_logger()
 
-        # Run complete 
-        utils.flush_print()
-        utils.flush_print('Run finished - quiting!')
-        self.clean_up()
+    def check_logger(self):
+        """
+        Reports (once) if the async log writer has failed - the run continues but rows
+        are dropped.
+        """
+        error = getattr(self.logger, 'error', None)
+        if error is not None and not self.logger_error_reported:
+            self.logger_error_reported = True
+            self.status_console.message('log writer failed, rows are being dropped: {0}'.format(
+                error.strip().splitlines()[-1]))
 
+    def control_update(self,message):
+        """
+        Handles a new message (or None if the wait for one timed out), updates the 
+        protocol, sets the trigger and writes to the logfile. 
+        """
+        self.time_now = time.time()
+        if message is not None:
+            self.message_switchyard(message)
+
+        if message is not None or self.data.count > 0:
+            self.protocol.update(self.time_elapsed, self.data)
+            t_protocol = time.time()
+            if self.protocol.pulse_on:
+                written = self.trigger_device.set_high()
+            else:
+                written = self.trigger_device.set_low()
+            # Only updates which write to the trigger device have a trigger stamp
+            t_trigger = time.time() if written else float('nan')
+            if written and self.latency is not None:
+                self.latency.add_trigger(t_protocol, t_trigger)
+
+        if message is not None:
+            if self.latency is not None:
+                stamps = self.frame_stamps
+                stamps['t_publish'] = message.get('t_publish', float('nan'))
+                stamps['t_receive'] = message.get('t_receive', float('nan'))
+                stamps['t_dequeue'] = self.time_now
+                stamps['t_protocol'] = t_protocol
+                stamps['t_trigger'] = t_trigger
+                self.latency.add(*[stamps[name] for name in LatencyStats.Stamp_Names])
+            self.write_logfile()
+
+    def run_finished(self):
+        message = self.status_console.message
+        message()
+        message('Run finished - quiting!')
+        if self.display_count > 0:
+            message('max display update dt = {0:1.4f}'.format(self.display_dt_max))
+        if self.latency is not None:
+            self.latency.print_summary(message)
+        self.clean_up()
 
+    def update_display(self):
+        if self.display is None:
+            return
+        time_begin = time.time()
+        if self.protocol.active: 
+            self.display.set_stim_center(self.protocol.stim_x, self.protocol.stim_y) 
+            self.display.set_stim_enabled(True)
+        else:
+            self.display.set_stim_enabled(False)
+        self.display.update(self.data)
+        self.display_count += 1
+        self.display_dt_max = max(self.display_dt_max, time.time() - time_begin)
 
     def message_switchyard(self,message):
         if message['type'] == 'reset':
@@ -153,7 +389,7 @@ class FicTracVendomatic(object):
         elif message['type'] == 'data':
             self.on_data_message(message)
         else:
-            utils.flush_print('unknown message type')
+            self.status_console.message('unknown message type')
 
     def on_reset_message(self,message):
         #utils.flush_print('reset')
@@ -168,28 +404,29 @@ class FicTracVendomatic(object):
         message['vely'] *= self.param['ball_radius']
 
         self.data.add(self.time_elapsed, message)
-        print('hello')
-        utils.flush_print('time          = {0:1.3f}'.format(self.time_elapsed))
-        utils.flush_print('frame         = {0}'.format(self.data.frame))
-        utils.flush_print('pos x         = {0:1.3f}'.format(self.data.posx))
-        utils.flush_print('pos y         = {0:1.3f}'.format(self.data.posy))
-        utils.flush_print('path_len      = {0:1.3f}'.format(self.data.path_len))
-        utils.flush_print('ready         = {0}'.format(self.protocol.ready))
-        utils.flush_print('win_dist      = {0:1.3f}'.format(self.protocol.get_window_distance(self.time_elapsed,self.data)))
-        if self.protocol.ready:
-            utils.flush_print('active        = {0}'.format(self.protocol.active))
-        else:
-            utils.flush_print('active        = --- ')
-        if self.protocol.ready and self.protocol.active:
-            utils.flush_print('outside_dt    = {0:1.3f}'.format(self.time_elapsed - self.protocol.time_outer_circle))
-            utils.flush_print('pulse_on      = {0}'.format(self.protocol.pulse_on))
-            utils.flush_print('pulse_on_dt   = {0:1.3f}'.format(self.time_elapsed - self.protocol.time_pulse_on))
-        else:
-            utils.flush_print('outer_dt      = --- ')
-            utils.flush_print('pulse_on      = --- ')
-            utils.flush_print('pulse_on_dt   = --- ')
-        utils.flush_print()
 
+    def update_status(self):
+        """
+        Shows the latest state on the status console (called at status_rate).
+        """
+        self.check_logger()
+        if self.status_console.mode == 'quiet' or self.data.count == 0:
+            return
+        is_active = self.protocol.ready and self.protocol.active
+        status = [
+                ('time', self.time_elapsed),
+                ('frame', self.data.frame),
+                ('posx', self.data.posx),
+                ('posy', self.data.posy),
+                ('path_len', self.data.path_len),
+                ('ready', self.protocol.ready),
+                ('win_dist', self.protocol.get_window_distance(self.time_elapsed,self.data)),
+                ('active', self.protocol.active if self.protocol.ready else None),
+                ('outside_dt', self.time_elapsed - self.protocol.time_outer_circle if is_active else None),
+                ('pulse_on', self.protocol.pulse_on if is_active else None),
+                ('pulse_on_dt', self.time_elapsed - self.protocol.time_pulse_on if is_active else None),
+                ]
+        self.status_console.show(status)
 
     def message_reciever(self):
         """
@@ -198,36 +435,54 @@ class FicTracVendomatic(object):
         for item in self.redis_pubsub.listen():
             if item['data'] == 1:
                 continue
-            message = json.loads(item['data'])
+            t_receive = time.time()
+            message = self.message_decoder.decode(item['data'])
+            message['t_receive'] = t_receive
             self.message_queue.put(message)
 
     def write_logfile(self):
         if self.time_log is None or ((self.time_elapsed - self.time_log) >  self.param['logfile_dt']):
             self.time_log = self.time_elapsed
-            log_data = { 
-                    'time': self.time_elapsed,
-                    'frame': self.data.frame,
-                    'posx': self.data.posx,
-                    'posy': self.data.posy,
-                    'velx': self.data.velx,
-                    'vely': self.data.vely,
-                    'path_len': self.data.path_len,
-                    'ready': int(self.protocol.ready),
-                    'win_dist': self.protocol.get_window_distance(self.time_elapsed, self.data),
-                    'active': int(self.protocol.active),
-                    'outside_dt': self.time_elapsed - self.protocol.time_outer_circle,
-                    'pulse_on': int(self.protocol.pulse_on),
-                    'pulse_on_dt': self.time_elapsed - self.protocol.time_pulse_on,
-                    'stimx': self.protocol.stim_x,
-                    'stimy': self.protocol.stim_y,
-                    }
+            log_data = self.protocol.get_log_data(self.time_elapsed, self.data)
+            if self.latency is not None:
+                log_data.update(self.frame_stamps)
             self.logger.add(log_data)
 
     def sigint_handler(self, signum, frame):
         self.done = True
 
     def clean_up(self):
-        self.logger.reset()
-        if self.trigger_device.isOpen():
-            self.trigger_device.set_low()
-
+        # Release the trigger device first so nothing below can leave it high
+        try:
+            if self.trigger_device.isOpen():
+                try:
+                    self.trigger_device.set_low()
+                finally:
+                    self.trigger_device.close()
+            if isinstance(self.trigger_device, AsyncTriggerDevice):
+                self.trigger_device.print_summary(self.status_console.message)
+        except RuntimeError as err:
+            # Async trigger io thread failed - report it
+            self.status_console.message(str(err))
+        finally:
+            try:
+                self.logger.close()
+            except RuntimeError as err:
+                # Async writer failed - report it
+                self.status_console.message(str(err))
+            if self.display is not None:
+                self.display.close()
+            if self.logger.num_dropped > 0:
+                self.status_console.message('logger dropped {0} rows'.format(self.logger.num_dropped))
+
+
+async def run_async_clients(client_list):
+    """
+    Runs several FicTracVendomatic clients (created with runtime='asyncio') on one 
+    event loop, e.g. to multiplex several redis channels in one process. 
+    """
+    def sigint_handler(signum, frame):
+        for client in client_list:
+            client.done = True
+    signal.signal(signal.SIGINT, sigint_handler)
+    await asyncio.gather(*[client.run_async() for client in client_list])
@@ -1,4 +1,5 @@
 from . import utils
+from .ring_buffer import RingBuffer
 
 class FlyData(object):
 
@@ -11,8 +12,13 @@ class FlyData(object):
             'heading': 0.0
             }
 
+    path_fields = ('time', 'posx', 'posy', 'heading')
+    default_path_buffer_size = 60*60*10*100  # 10 hours at 100Hz
+
     def __init__(self,param):
         self.param = param
+        buffer_size = self.param.get('path_buffer_size', self.default_path_buffer_size)
+        self.path_buffer = RingBuffer(buffer_size, self.path_fields)
         self.reset() # Initialize member data
         
     def add(self,t, data):
@@ -20,9 +26,7 @@ class FlyData(object):
         # Add new data points
         self.prev_data = self.curr_data
         self.curr_data = data
-        self.time_list.append(t)
-        self.posx_list.append(data['posx'])
-        self.posy_list.append(data['posy'])
+        self.path_buffer.append(t, data['posx'], data['posy'], data['heading'])
         if self.count >= 2:
             dx = self.curr_data['posx'] - self.prev_data['posx']
             dy = self.curr_data['posy'] - self.prev_data['posy']
@@ -30,11 +34,24 @@ class FlyData(object):
         self.count+=1
 
         # Cull old data points
-        while (t - self.time_list[0]) > self.param['path_window']:
-            self.time_list.pop(0)
-            self.posx_list.pop(0)
-            self.posy_list.pop(0)
+        while (t - self.path_buffer.first('time')) > self.param['path_window']:
+            self.path_buffer.popleft()
+
+    @property
+    def time_list(self):
+        return self.path_buffer.view('time')
+
+    @property
+    def posx_list(self):
+        return self.path_buffer.view('posx')
+
+    @property
+    def posy_list(self):
+        return self.path_buffer.view('posy')
 
+    @property
+    def heading_list(self):
+        return self.path_buffer.view('heading')
 
     @property
     def frame(self):
@@ -64,13 +81,10 @@ class FlyData(object):
         self.count = 0
         self.curr_data = self.zero_data
         self.prev_data = self.zero_data
-        self.time_list = []
-        self.posx_list = []
-        self.posy_list = []
-        self.heading_list = []
-        self.path_len = 0
+        self.path_buffer.clear()
+        self.path_len = 0.0
 
     def reset_path_len(self):
-        self.path_len = 0
+        self.path_len = 0.0
     
 
@@ -2,6 +2,13 @@ from __future__ import print_function
 
 import os
 import os.path
+import sys
+import time
+import queue
+import threading
+import traceback
+import subprocess
+import multiprocessing
 
 import h5py
 import numpy as np
@@ -11,21 +18,131 @@ import json
 
 class H5Logger(object):
 
+    """
+    Logs rows of data (dicts with the same keys each row) to an hdf5 file. 
+
+    Rows are accumulated in preallocated numpy blocks and appended to the hdf5 file 
+    in chunk aligned batches of chunk_size rows (or sooner if more than flush_dt 
+    seconds have elapsed since the last write). Any buffered rows are written when 
+    flush or reset are called. 
+
+    When compound is True all values in a row are stored together in a single 
+    compound dtype dataset (named 'data') rather than in one dataset per key.
+
+    Segmented logs: when segment_dt (seconds) and/or segment_rows are set, the log is
+    rolled over to a new (auto-incremented) file once the current segment's duration
+    or number of rows is reached. A small json manifest (named after the first 
+    segment, e.g. data000001_manifest.json) lists the segments of the session along 
+    with their number of rows and time range and each segment's attributes link it to
+    the manifest and previous segment. The manifest is rewritten when each segment is
+    opened and whenever rows are flushed, so after a crash it lists every segment 
+    (including the current one) with the rows written to it.
+
+    When prealloc_rows is set the datasets of each file are preallocated to that many
+    rows (and trimmed to the rows written when the file is closed). The number of 
+    rows written is kept in the file's num_rows attribute.
+
+    When swmr is True files are written in hdf5 single writer multiple reader mode so
+    they can be read while being written (see H5TailReader). Rows become visible to
+    readers when they are flushed. As attributes can not be changed in swmr mode the
+    datasets are not preallocated. 
+
+    When overview_factors (list of block sizes) is set, multi-resolution overview 
+    levels (the min, max and mean of each value over blocks of rows, see overview.py) 
+    are added to each file after it is closed. They are built in a background process
+    (see overview_worker.py), so segment rollovers do not stall add, 
+    and close waits for them to finish and raises a RuntimeError if any failed.
+
+    Compression: compression is 'gzip', 'lzf', 'blosc' (blosc with lz4) or 'lz4' (the
+    last two require the hdf5plugin package) and is applied to every dataset, or a 
+    dict (key -> compression) to compress datasets differently (keys not in the dict 
+    are not compressed). compression_opts is the gzip or blosc level (0-9, lzf and lz4
+    take no options so it is ignored for them). A compression can also be given with
+    its own level as (compression, level), e.g. {'posx': ('gzip', 4), 'pulse_on': 
+    'lzf'}. shuffle enables the byte shuffle filter, which usually improves 
+    compression of numeric values. dtypes (dict key -> dtype, or 'compact' for 
+    Compact_Dtypes) sets the dtype values are stored with, e.g. int8 for flags and 
+    float32 for positions, instead of the dtype of the values in the first row.
+
+    """
+
     Default_Auto_Incr_Format = '{0:06d}'
+    Default_Chunk_Size = 1000
+    Default_Flush_Dt = 1.0
+    Compound_Dataset_Name = 'data'
+    Manifest_Suffix = '_manifest.json'
+    Compression_List = ('gzip', 'lzf', 'blosc', 'lz4')
+    Overview_Module = 'fictrac_vendomatic.overview_worker'
+    Compact_Dtypes = {
+            'frame': 'int32',
+            'posx': 'float32', 
+            'posy': 'float32', 
+            'velx': 'float32', 
+            'vely': 'float32', 
+            'path_len': 'float32',
+            'ready': 'int8',
+            'win_dist': 'float32',
+            'active': 'int8',
+            'pulse_on': 'int8',
+            'stimx': 'float32',
+            'stimy': 'float32',
+            }
+
+    num_dropped = 0 # rows are never dropped by the synchronous logger
 
     def __init__(
             self,
             filename='data.hdf5',
             auto_incr=False, 
             auto_incr_format=Default_Auto_Incr_Format,
-            param_attr = None
+            param_attr = None,
+            chunk_size = Default_Chunk_Size,
+            flush_dt = Default_Flush_Dt, 
+            compound = False,
+            segment_dt = None,
+            segment_rows = None,
+            prealloc_rows = None,
+            swmr = False,
+            overview_factors = None,
+            compression = None,
+            compression_opts = None,
+            shuffle = False,
+            dtypes = None,
             ):
+        if (segment_dt or segment_rows) and not auto_incr:
+            raise(ValueError('segmented logs require auto_incr'))
+        self.segment_dt = segment_dt
+        self.segment_rows = segment_rows
+        self.swmr = swmr
+        self.overview_factors = overview_factors
+        self.overview_proc_list = []
+        self.overview_failed = []
+        if isinstance(compression, dict) and compound:
+            raise(ValueError('compound log files have a single dataset - compression must be a string'))
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.shuffle = shuffle
+        if dtypes == 'compact':
+            dtypes = self.Compact_Dtypes
+        elif dtypes is not None and not isinstance(dtypes, dict):
+            raise(ValueError('dtypes must be a dict or compact'))
+        self.dtypes = dtypes if dtypes is not None else {}
+        # Check the compression settings now rather than when the first row is added
+        for value in (compression.values() if isinstance(compression, dict) else [compression]):
+            get_filter_kwargs(value, compression_opts, shuffle)
+        self.prealloc_rows = int(prealloc_rows) if prealloc_rows and not swmr else None
+        self.segment_list = []
+        self.manifest_filename = None
         self.auto_incr = auto_incr
         self.auto_incr_format = auto_incr_format
+        self.chunk_size = int(chunk_size)
+        self.flush_dt = flush_dt
+        self.compound = compound
         self.h5file = None
         self.dataset_dict = None 
         self.filename = filename
         self.param_attr = param_attr
+        self.clear_buffer()
 
     @property
     def filename(self):
@@ -62,63 +179,492 @@ class H5Logger(object):
             next_filename = os.path.join(dirname, filename_w_incr)
         return next_filename
 
+    def clear_buffer(self):
+        self.row_count = 0
+        self.keys = None
+        self.key_set = None
+        self.buffer = None
+        self.buffer_count = 0
+        self.time_flush = time.time()
+
+    @property
+    def is_segmented(self):
+        return bool(self.segment_dt or self.segment_rows)
+
     def reset(self):
+        self.close_file()
+        if self.segment_list:
+            self.write_manifest(complete=True)
+        self.segment_list = []
+        self.manifest_filename = None
+        self.clear_buffer()
+
+    def close_file(self):
         if self.h5file is not None:
+            self.flush()
+            if self.prealloc_rows:
+                for dataset in self.dataset_dict.values():
+                    dataset.resize((self.row_count,) + dataset.shape[1:])
+            filename = self.h5file.filename
             self.h5file.close()
+            if self.overview_factors:
+                self.start_overview(filename)
         self.h5file = None
         self.dataset_dict = None 
 
+    def close(self):
+        self.reset()
+        self.check_overview(wait=True)
+        failed, self.overview_failed = self.overview_failed, []
+        if failed:
+            raise(RuntimeError('building overview levels failed for: {0}'.format(', '.join(failed))))
+
+    def start_overview(self, filename):
+        """
+        Builds the overview levels of (closed) file filename in a background process.
+        """
+        self.check_overview()
+        cmd = [sys.executable, '-m', self.Overview_Module, filename]
+        cmd.extend([str(factor) for factor in self.overview_factors])
+        self.overview_proc_list.append((subprocess.Popen(cmd), filename))
+
+    def check_overview(self, wait=False):
+        """
+        Removes finished overview processes, keeping the files of those which failed 
+        in overview_failed. If wait is True waits for all of them to finish. 
+        """
+        running_list = []
+        for proc, filename in self.overview_proc_list:
+            returncode = proc.wait() if wait else proc.poll()
+            if returncode is None:
+                running_list.append((proc, filename))
+            elif returncode != 0:
+                self.overview_failed.append(filename)
+        self.overview_proc_list = running_list
+
     def add(self,data):
         
+        if self.h5file is not None:
+            if set(data.keys()) != self.key_set:
+                raise(ValueError('keys in data do not match those is existing dataset'))
+            if self.is_segmented and self.is_segment_done():
+                self.close_file()
+                self.write_manifest()
         if self.h5file is None:
-            # Create h5df file and dataset_dict file and add values
-            next_filename = self.get_next_filename()
-            self.h5file = h5py.File(next_filename,'w')
-            self.dataset_dict = {}
-            for key,val in data.items():
-                if not type(val) == np.ndarray:
-                    val_as_np = convert_to_np(val)
-                else:
-                    val_as_np = np.reshape(val, (1,) + val.shape)
-                dtype = val_as_np.dtype
-                shape = (1,) + val_as_np.shape[1:]
-                maxshape = (None,) + val_as_np.shape[1:]
-                self.dataset_dict[key] = self.h5file.create_dataset(key, shape, maxshape=maxshape, dtype=dtype)
-                self.dataset_dict[key][0] = val_as_np
-
-            # Add data creation time 
-            now = arrow.now()
-            self.h5file.attrs['timestamp'] = now.timestamp
-            self.h5file.attrs['datetime'] = now.format('YYYY-MM-DD HH:mm:ss')
-
-            # Add parameter attribute is it exists
-            if self.param_attr is not None:
-                jsonparam = json.dumps(self.param_attr)
-                self.h5file.attrs['jsonparam'] = jsonparam
+            self.create_file(data)
 
+        # Add row to buffer
+        if self.compound:
+            self.buffer[self.buffer_count] = tuple(data[key] for key in self.keys)
         else:
-            # Add data to existing hdf5 file dataset_dict
-            if set(data.keys()) != set(self.dataset_dict.keys()):
-                raise(ValueError('keys in data do not match those is existing dataset'))
             for key, val in data.items():
-                shape = self.dataset_dict[key].shape
-                num_vals = shape[0]
-                self.dataset_dict[key].resize((num_vals+1,) + shape[1:])
-                if not type(val) == np.ndarray:
-                    val_as_np = convert_to_np(val)
-                else:
-                    val_as_np = np.reshape(val, (1,) + val.shape) 
-                self.dataset_dict[key][num_vals] = val_as_np
+                self.buffer[key][self.buffer_count] = val
+        self.buffer_count += 1
+
+        # Write buffered rows when block is full or flush interval has elapsed
+        if self.buffer_count >= self.chunk_size:
+            self.flush()
+        elif self.flush_dt is not None and (time.time() - self.time_flush) > self.flush_dt:
+            self.flush()
+
+    def is_segment_done(self):
+        num_rows = self.row_count + self.buffer_count
+        if self.segment_rows and num_rows >= self.segment_rows:
+            return True
+        if self.segment_dt and (time.time() - self.time_segment) >= self.segment_dt:
+            return True
+        return False
+
+    def create_file(self,data):
+        # Create h5df file, dataset_dict and row buffers based on first row of data
+        next_filename = self.get_next_filename()
+        if self.swmr:
+            self.h5file = h5py.File(next_filename,'w',libver='latest')
+        else:
+            self.h5file = h5py.File(next_filename,'w')
+        self.keys = list(data.keys())
+        self.key_set = set(self.keys)
+        self.dataset_dict = {}
+        self.row_count = 0
+        self.buffer_count = 0
+        self.time_segment = time.time()
+        num_alloc = self.prealloc_rows if self.prealloc_rows else 0
+
+        field_list = []
+        for key in self.keys:
+            val_as_np = convert_to_np(data[key])
+            dtype = np.dtype(self.dtypes.get(key, val_as_np.dtype))
+            field_list.append((key, dtype, val_as_np.shape[1:]))
+
+        if self.compound:
+            dtype = np.dtype(field_list)
+            self.buffer = np.zeros((self.chunk_size,), dtype=dtype)
+            self.dataset_dict[self.Compound_Dataset_Name] = self.h5file.create_dataset(
+                    self.Compound_Dataset_Name, 
+                    (num_alloc,), 
+                    maxshape=(None,), 
+                    chunks=(self.chunk_size,), 
+                    dtype=dtype,
+                    **self.get_filter_kwargs(self.Compound_Dataset_Name)
+                    )
+        else:
+            self.buffer = {}
+            for key, dtype, shape in field_list: 
+                self.buffer[key] = np.zeros((self.chunk_size,) + shape, dtype=dtype)
+                self.dataset_dict[key] = self.h5file.create_dataset(
+                        key, 
+                        (num_alloc,) + shape, 
+                        maxshape=(None,) + shape, 
+                        chunks=(self.chunk_size,) + shape, 
+                        dtype=dtype,
+                        **self.get_filter_kwargs(key)
+                        )
+
+        # Add data creation time 
+        now = arrow.now()
+        self.h5file.attrs['timestamp'] = now.float_timestamp
+        self.h5file.attrs['datetime'] = now.format('YYYY-MM-DD HH:mm:ss')
+
+        # Add parameter attribute is it exists
+        if self.param_attr is not None:
+            jsonparam = json.dumps(self.param_attr)
+            self.h5file.attrs['jsonparam'] = jsonparam
+
+        if self.prealloc_rows:
+            self.h5file.attrs['num_rows'] = 0
+
+        # Link segment to manifest and previous segment
+        if self.is_segmented:
+            if not self.segment_list:
+                self.manifest_filename = os.path.splitext(next_filename)[0] + self.Manifest_Suffix
+            self.h5file.attrs['segment_index'] = len(self.segment_list)
+            self.h5file.attrs['segment_manifest'] = os.path.basename(self.manifest_filename)
+            if self.segment_list:
+                self.h5file.attrs['segment_prev'] = self.segment_list[-1]['filename']
+            self.segment_list.append({
+                'filename': os.path.basename(next_filename),
+                'datetime': now.format('YYYY-MM-DD HH:mm:ss'),
+                'num_rows': 0,
+                'time_start': None,
+                'time_end': None,
+                })
+            self.write_manifest()
+
+        # No new objects or attributes can be created after this
+        if self.swmr:
+            self.h5file.swmr_mode = True
+
+    def get_filter_kwargs(self, key):
+        """
+        Returns the create_dataset filter keyword arguments for dataset key.
+        """
+        if isinstance(self.compression, dict):
+            return get_filter_kwargs(self.compression.get(key, None), self.compression_opts, self.shuffle)
+        return get_filter_kwargs(self.compression, self.compression_opts, self.shuffle)
+
+    def write_manifest(self, complete=False):
+        """
+        Writes the json manifest listing the segments of the current session.
+        """
+        manifest = {
+                'segment_dt': self.segment_dt,
+                'segment_rows': self.segment_rows,
+                'complete': complete,
+                'segments': self.segment_list,
+                }
+        tmp_filename = self.manifest_filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_filename, self.manifest_filename)
+
+    def flush(self):
+        """
+        Write any buffered rows to the hdf5 file.
+        """
+        self.time_flush = time.time()
+        if self.h5file is None or self.buffer_count == 0:
+            return
+        num_new = self.buffer_count
+        num_vals = self.row_count
+        for key, dataset in self.dataset_dict.items():
+            if self.compound:
+                block = self.buffer[:num_new]
+            else:
+                block = self.buffer[key][:num_new]
+            if num_vals + num_new > dataset.shape[0]:
+                dataset.resize((num_vals + num_new,) + dataset.shape[1:])
+            dataset[num_vals:num_vals+num_new] = block
+        self.row_count += num_new
+        if self.prealloc_rows:
+            self.h5file.attrs['num_rows'] = self.row_count
+        if self.is_segmented:
+            self.update_segment_info(num_new)
+        self.h5file.flush()
+        self.buffer_count = 0
+
+    def update_segment_info(self, num_new):
+        info = self.segment_list[-1]
+        info['num_rows'] = self.row_count
+        if 'time' in self.key_set:
+            time_vals = self.buffer['time'][:num_new]
+            if info['time_start'] is None:
+                info['time_start'] = float(time_vals[0])
+            info['time_end'] = float(time_vals[-1])
+        self.write_manifest()
+
+
+class AsyncH5Logger(object):
+
+    """
+    Asynchronous version of the H5Logger. Rows passed to add are handed to a bounded 
+    queue and written by an H5Logger owned by a dedicated writer thread or process
+    (writer='thread' or 'process') so that disk stalls never block the caller. 
+
+    When the queue is full new rows are dropped (and counted in num_dropped) rather 
+    than blocking. Calls to flush and reset are queued in order with the rows, waiting
+    at most Put_Timeout for space in the queue. close waits for the writer to drain 
+    the queue, closes the file and stops the writer. 
+
+    If the writer fails (e.g. disk full) its error is sent back. add (the hot path) 
+    only checks for it every Check_Dt seconds and never raises - once the writer has
+    failed rows are dropped (and counted in num_dropped) and the error is kept in 
+    error. flush, reset and close raise it as a RuntimeError.
+
+    Keyword arguments other than writer and queue_size are passed to the H5Logger.
+
+    """
+
+    Default_Queue_Size = 10000
+    Writer_Join_Timeout = 30.0
+    Put_Timeout = 5.0
+    Check_Dt = 1.0
+
+    def __init__(self, writer='process', queue_size=Default_Queue_Size, **kwargs): 
+        flush_dt = kwargs.get('flush_dt', H5Logger.Default_Flush_Dt)
+        if flush_dt is None:
+            flush_dt = H5Logger.Default_Flush_Dt
+        if writer == 'thread':
+            self.queue = queue.Queue(maxsize=queue_size)
+            self.error_queue = queue.Queue()
+            worker_cls = threading.Thread
+        elif writer == 'process':
+            self.queue = multiprocessing.Queue(maxsize=queue_size)
+            self.error_queue = multiprocessing.Queue()
+            worker_cls = multiprocessing.Process
+        else:
+            raise(ValueError('unknown writer {0}, must be thread or process'.format(writer)))
+        self.writer = writer
+        self.num_added = 0
+        self.num_dropped = 0
+        self.error = None
+        self.closed = False
+        self.time_check = time.time() + self.Check_Dt
+        self.worker = worker_cls(target=async_writer_loop, args=(self.queue, self.error_queue, kwargs, flush_dt))
+        self.worker.daemon = True
+        self.worker.start()
+
+    def add(self,data):
+        self.num_added += 1
+        if self.error is None:
+            time_now = time.time()
+            if time_now >= self.time_check:
+                self.time_check = time_now + self.Check_Dt
+                self.poll_writer()
+        if self.error is not None:
+            self.num_dropped += 1
+            return
+        try:
+            self.queue.put_nowait(('add', data))
+        except queue.Full:
+            self.num_dropped += 1
+
+    def flush(self):
+        self.put_cmd('flush')
+
+    def reset(self):
+        self.put_cmd('reset')
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.worker.is_alive():
+            try:
+                self.queue.put(('close', None), timeout=self.Put_Timeout)
+            except queue.Full:
+                pass
+            self.worker.join(self.Writer_Join_Timeout)
+        self.check_writer(closing=True)
+
+    def put_cmd(self, cmd):
+        self.check_writer()
+        try:
+            self.queue.put((cmd, None), timeout=self.Put_Timeout)
+        except queue.Full:
+            self.check_writer()
+            raise(RuntimeError('log writer not responding - {0} timed out'.format(cmd)))
+
+    def poll_writer(self, closing=False):
+        """
+        Sets error if the writer has failed or stopped.
+        """
+        if self.error is None:
+            try:
+                self.error = self.error_queue.get_nowait()
+            except queue.Empty:
+                if not closing and not self.worker.is_alive():
+                    self.error = 'writer stopped unexpectedly'
+
+    def check_writer(self, closing=False):
+        """
+        Raises RuntimeError if the writer has failed or stopped.
+        """
+        self.poll_writer(closing)
+        if self.error is not None:
+            raise(RuntimeError('log writer failed: {0}'.format(self.error)))
+
+
+def async_writer_loop(cmd_queue, error_queue, logger_kwargs, flush_dt): 
+    """
+    Writer loop for AsyncH5Logger - runs in the writer thread or process. Errors are
+    sent back on error_queue and stop the writer.
+    """
+    try:
+        logger = H5Logger(**logger_kwargs)
+        while True:
+            try:
+                cmd, data = cmd_queue.get(timeout=flush_dt)
+            except queue.Empty:
+                logger.flush()
+                continue
+            if cmd == 'add':
+                logger.add(data)
+            elif cmd == 'flush':
+                logger.flush()
+            elif cmd == 'reset':
+                logger.reset()
+            elif cmd == 'close':
+                logger.close()
+                break
+    except Exception:
+        error_queue.put(traceback.format_exc())
+
+
+class H5TailReader(object):
+
+    """
+    Reads the rows appended to an H5Logger log file while it is being written (by an
+    H5Logger with swmr=True). Each call to read_new refreshes the datasets and reads
+    only the rows added since the previous call. As the datasets are extended one 
+    after the other only rows which are present in every dataset are returned.
+
+    """
+
+    Default_Poll_Dt = 0.1
+
+    def __init__(self, filename, keys=None):
+        self.h5file = h5py.File(filename, 'r', libver='latest', swmr=True)
+        self.compound = H5Logger.Compound_Dataset_Name in self.h5file
+        if self.compound:
+            self.dataset_list = [self.h5file[H5Logger.Compound_Dataset_Name]]
+            self.keys = list(self.dataset_list[0].dtype.names) if keys is None else list(keys)
+        else:
+            self.keys = [k for k in self.h5file.keys() if isinstance(self.h5file[k], h5py.Dataset)] if keys is None else list(keys)
+            self.dataset_list = [self.h5file[key] for key in self.keys]
+        self.num_read = 0
+
+    @property
+    def num_rows(self):
+        """
+        Number of rows available (refreshes the datasets).
+        """
+        for dataset in self.dataset_list:
+            dataset.refresh()
+        return min([dataset.shape[0] for dataset in self.dataset_list])
+
+    def read_new(self, max_rows=None):
+        """
+        Returns dict (key -> array) of the rows appended since the last call (arrays 
+        may be empty). 
+        """
+        num_rows = self.num_rows
+        if max_rows is not None:
+            num_rows = min(num_rows, self.num_read + max_rows)
+        if self.compound:
+            block = self.dataset_list[0][self.num_read:num_rows]
+            rows = {key: block[key] for key in self.keys}
+        else:
+            rows = {key: dataset[self.num_read:num_rows] for key, dataset in zip(self.keys, self.dataset_list)}
+        self.num_read = max(num_rows, self.num_read)
+        return rows
+
+    def follow(self, poll_dt=Default_Poll_Dt, timeout=None):
+        """
+        Generator which yields blocks of new rows (see read_new) as they are written. 
+        Stops when no new rows have been added for timeout seconds (if not None).
+        """
+        time_last = time.time()
+        while True:
+            rows = self.read_new()
+            if len(rows[self.keys[0]]) > 0:
+                time_last = time.time()
+                yield rows
+            elif timeout is not None and time.time() - time_last > timeout:
+                break
+            else:
+                time.sleep(poll_dt)
+
+    def close(self):
+        self.h5file.close()
 
 
 # Utility functions
 # -------------------------------------------------------------------------------------------------
 
+def get_filter_kwargs(compression=None, compression_opts=None, shuffle=False):
+    """
+    Returns the h5py create_dataset keyword arguments for the compression and shuffle
+    filters. compression can be a (compression, level) pair, the level overrides 
+    compression_opts.
+    """
+    if isinstance(compression, (tuple, list)):
+        if len(compression) != 2:
+            raise(ValueError('compression must be a name or (name, level), got {0}'.format(compression)))
+        compression, compression_opts = compression
+    if compression is None:
+        return {'shuffle': True} if shuffle else {}
+    if compression not in H5Logger.Compression_List:
+        raise(ValueError('unknown compression {0}, must be one of {1}'.format(compression, H5Logger.Compression_List)))
+    if compression in ('lzf', 'lz4'):
+        compression_opts = None # no options
+    elif compression_opts is not None and compression_opts not in range(10):
+        raise(ValueError('{0} compression level must be 0-9, got {1}'.format(compression, compression_opts)))
+    if compression in ('gzip', 'lzf'):
+        kwargs = {'compression': compression, 'shuffle': shuffle}
+        if compression_opts is not None:
+            kwargs['compression_opts'] = compression_opts
+        return kwargs
+    try:
+        import hdf5plugin
+    except ImportError:
+        raise(ValueError('{0} compression requires the hdf5plugin package'.format(compression)))
+    if compression == 'blosc':
+        # Blosc does its own (faster) shuffle
+        return dict(hdf5plugin.Blosc(
+            cname = 'lz4', 
+            clevel = compression_opts if compression_opts is not None else 5,
+            shuffle = hdf5plugin.Blosc.SHUFFLE if shuffle else hdf5plugin.Blosc.NOSHUFFLE,
+            ))
+    kwargs = dict(hdf5plugin.LZ4())
+    kwargs['shuffle'] = shuffle
+    return kwargs
+
+
 def convert_to_np(val):
     if type(val) != np.ndarray:
         return np.array([val])
     else:
-        return val
+        return np.reshape(val, (1,) + val.shape)
 
 def fileparts(filename): 
     dirname, filename_only = os.path.split(filename)
@@ -0,0 +1,88 @@
+from __future__ import print_function
+import numpy
+from . import utils
+
+
+class LatencyHistogram(object):
+
+    """
+    Fixed memory histogram of latencies (in seconds) with log spaced bins from
+    min_latency to max_latency. Percentiles are estimated from the bin edges.
+    """
+
+    def __init__(self, min_latency=1.0e-6, max_latency=10.0, bins_per_decade=50):
+        num_decades = numpy.log10(max_latency/min_latency)
+        num_bins = int(numpy.ceil(num_decades*bins_per_decade))
+        self.edges = numpy.logspace(numpy.log10(min_latency), numpy.log10(max_latency), num_bins + 1)
+        self.counts = numpy.zeros((num_bins + 2,), dtype=numpy.int64) # + underflow, overflow
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self,value):
+        if value != value: # nan
+            return
+        self.counts[numpy.searchsorted(self.edges, value, side='right')] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.total/self.count if self.count else float('nan')
+
+    def percentile(self,q):
+        if not self.count:
+            return float('nan')
+        # Upper edge of the bin containing the q-th percentile
+        ind = numpy.searchsorted(numpy.cumsum(self.counts), q/100.0*self.count, side='left')
+        if ind >= len(self.edges):
+            return self.max
+        return min(self.edges[ind], self.max)
+
+
+class LatencyStats(object):
+
+    """
+    Per frame latency statistics for the control path. For each frame the timestamps
+    taken at publish (by FicTrac/FakeFicTrac, if present), redis receive, dequeue in
+    the main loop, protocol update completion and trigger write are added and the
+    latency of each stage (and of the whole path) is accumulated in a histogram.
+
+    t_trigger is nan for frames which do not write to the trigger device (trigger 
+    state unchanged) and their total ends at the protocol update. The protocol->trigger
+    histogram is filled by add_trigger, once for every trigger edge written, including
+    edges written on timeout ticks without a frame (e.g. the end of a pulse). With an
+    AsyncTriggerDevice t_trigger is the time the command was queued for the io thread.
+    """
+
+    Stamp_Names = ('t_publish', 't_receive', 't_dequeue', 't_protocol', 't_trigger')
+    Stage_Names = ('publish->receive', 'receive->dequeue', 'dequeue->protocol', 'protocol->trigger', 'total')
+
+    def __init__(self):
+        self.hist_dict = {name: LatencyHistogram() for name in self.Stage_Names}
+
+    def add(self, t_publish, t_receive, t_dequeue, t_protocol, t_trigger):
+        self.hist_dict['publish->receive'].add(t_receive - t_publish)
+        self.hist_dict['receive->dequeue'].add(t_dequeue - t_receive)
+        self.hist_dict['dequeue->protocol'].add(t_protocol - t_dequeue)
+        t_first = t_publish if t_publish == t_publish else t_receive
+        if t_trigger == t_trigger:
+            self.hist_dict['total'].add(t_trigger - t_first)
+        else:
+            self.hist_dict['total'].add(t_protocol - t_first)
+
+    def add_trigger(self, t_protocol, t_trigger):
+        self.hist_dict['protocol->trigger'].add(t_trigger - t_protocol)
+
+    def print_summary(self, print_func=utils.flush_print):
+        print_func()
+        print_func('latency (ms)        count     mean      p50      p90      p99      max')
+        for name in self.Stage_Names:
+            hist = self.hist_dict[name]
+            if not hist.count:
+                continue
+            vals = [hist.mean, hist.percentile(50), hist.percentile(90), hist.percentile(99), hist.max]
+            vals_str = ' '.join(['{0:8.3f}'.format(1.0e3*v) for v in vals])
+            print_func('{0:18s} {1:7d} {2}'.format(name, hist.count, vals_str))
+        print_func()
@@ -0,0 +1,196 @@
+from __future__ import print_function
+
+import json
+import bisect
+
+import h5py
+import numpy
+
+from .h5_logger import H5Logger
+
+
+class LogReader(object):
+
+    """
+    Lazy reader for H5Logger log files (per key or compound datasets). Nothing is read
+    when the file is opened: values are read on demand for row ranges, time ranges
+    (found by binary search on the time dataset, reading only O(log n) values) or in
+    chunks of rows, so large logs can be inspected without loading them into memory.
+
+    summary computes the duration, path length and number of pulses of the log in a
+    single pass over chunks of rows.
+
+    Overview levels (min, max and mean over blocks of rows, see overview.py) are read
+    with read_overview.
+
+    Note, the time search assumes time increases through the log, i.e. that it does not
+    contain reset messages (after which time restarts from zero).
+
+    """
+
+    Default_Chunk_Size = 100000
+    Overview_Group = 'overview'
+    Overview_Stats = ('min', 'max', 'mean')
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.h5file = h5py.File(filename, 'r')
+        self.compound = H5Logger.Compound_Dataset_Name in self.h5file
+        if self.compound:
+            self.dataset = self.h5file[H5Logger.Compound_Dataset_Name]
+            self.keys = list(self.dataset.dtype.names)
+            num_rows = self.dataset.shape[0]
+        else:
+            self.keys = [k for k in self.h5file.keys() if isinstance(self.h5file[k], h5py.Dataset)]
+            num_rows = min([self.h5file[k].shape[0] for k in self.keys]) if self.keys else 0
+        if 'num_rows' in self.h5file.attrs:
+            num_rows = min(num_rows, int(self.h5file.attrs['num_rows']))
+        self.num_rows = num_rows
+
+    def __len__(self):
+        return self.num_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def attrs(self):
+        return {k: v for k, v in self.h5file.attrs.items() if k != 'jsonparam'}
+
+    @property
+    def param(self):
+        if 'jsonparam' in self.h5file.attrs:
+            return json.loads(self.h5file.attrs['jsonparam'])
+        return None
+
+    def get_dataset(self, key):
+        """
+        Returns the (lazy) h5py dataset of values for key.
+        """
+        if key not in self.keys:
+            raise(KeyError('{0} not in log file'.format(key)))
+        if self.compound:
+            return self.dataset.fields(key)
+        return self.h5file[key]
+
+    def read(self, keys=None, start=0, stop=None, step=1):
+        """
+        Returns dict (key -> array) of the values in rows start to stop (with step).
+        """
+        keys = self.keys if keys is None else keys
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        start = min(start, stop)
+        if self.compound:
+            block = self.dataset.fields(list(keys))[start:stop:step]
+            return {key: block[key] for key in keys}
+        return {key: self.h5file[key][start:stop:step] for key in keys}
+
+    def find_time(self, t):
+        """
+        Returns index of first row with time >= t.
+        """
+        return bisect.bisect_left(LazySequence(self.get_dataset('time'), self.num_rows), t)
+
+    def time_slice(self, t_start=None, t_stop=None):
+        """
+        Returns slice of the rows with t_start <= time < t_stop.
+        """
+        start = 0 if t_start is None else self.find_time(t_start)
+        stop = self.num_rows if t_stop is None else self.find_time(t_stop)
+        return slice(start, stop)
+
+    def read_time_range(self, t_start=None, t_stop=None, keys=None, step=1):
+        """
+        Returns dict (key -> array) of the values for t_start <= time < t_stop.
+        """
+        rows = self.time_slice(t_start, t_stop)
+        return self.read(keys, rows.start, rows.stop, step)
+
+    def iter_chunks(self, keys=None, chunk_size=Default_Chunk_Size, start=0, stop=None):
+        """
+        Generator which yields dicts (key -> array) of chunks of chunk_size rows.
+        """
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        for pos in range(start, stop, chunk_size):
+            yield self.read(keys, pos, min(pos + chunk_size, stop))
+
+    def summary(self, chunk_size=Default_Chunk_Size, t_start=None, t_stop=None):
+        """
+        Returns dict with the number of rows, duration, path length and number of
+        pulses of the log (or time range), computed chunk by chunk.
+        """
+        rows = self.time_slice(t_start, t_stop)
+        keys = [k for k in ('time', 'posx', 'posy', 'pulse_on') if k in self.keys]
+        time_first = None
+        time_last = None
+        path_len = 0.0
+        num_pulses = 0
+        last = None
+        for chunk in self.iter_chunks(keys, chunk_size, rows.start, rows.stop):
+            if last is not None:
+                chunk = {k: numpy.concatenate(([last[k]], v)) for k, v in chunk.items()}
+            if 'time' in chunk:
+                if time_first is None:
+                    time_first = float(chunk['time'][0])
+                time_last = float(chunk['time'][-1])
+            if 'posx' in chunk and 'posy' in chunk:
+                path_len += float(numpy.sum(numpy.hypot(numpy.diff(chunk['posx']), numpy.diff(chunk['posy']))))
+            if 'pulse_on' in chunk:
+                pulse_on = chunk['pulse_on'].astype(bool)
+                num_pulses += int(numpy.sum(pulse_on[1:] & ~pulse_on[:-1]))
+                if last is None:
+                    num_pulses += int(pulse_on[0])
+            last = {k: v[-1] for k, v in chunk.items()}
+        return {
+                'num_rows': rows.stop - rows.start,
+                'time_start': time_first,
+                'time_end': time_last,
+                'duration': time_last - time_first if time_first is not None else 0.0,
+                'path_length': path_len,
+                'num_pulses': num_pulses,
+                }
+
+    @property
+    def overview_factors(self):
+        """
+        Sorted list of the overview factors (block sizes) in the file.
+        """
+        if self.Overview_Group not in self.h5file:
+            return []
+        return sorted([int(name) for name in self.h5file[self.Overview_Group]])
+
+    def read_overview(self, factor, keys=None, start=0, stop=None):
+        """
+        Returns dict (key -> dict of stat -> array) of the overview level with block
+        size factor for the blocks covering rows start to stop.
+        """
+        level = self.h5file['{0}/{1}'.format(self.Overview_Group, factor)]
+        keys = [k for k in self.keys if k in level['mean']] if keys is None else keys
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        block_start = start//factor
+        block_stop = -(-stop//factor)
+        return {key: {stat: level[stat][key][block_start:block_stop] for stat in self.Overview_Stats} for key in keys}
+
+    def close(self):
+        self.h5file.close()
+
+
+class LazySequence(object):
+
+    """
+    Sequence view of the first num values of a dataset, reading values on access
+    (for bisect).
+    """
+
+    def __init__(self, dataset, num):
+        self.dataset = dataset
+        self.num = num
+
+    def __len__(self):
+        return self.num
+
+    def __getitem__(self, i):
+        return self.dataset[i]
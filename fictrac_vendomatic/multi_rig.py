@@ -0,0 +1,216 @@
+from __future__ import print_function
+
+import os
+import sys
+import math
+import time
+import signal
+import multiprocessing
+
+from .fictrac_vendomatic import FicTracVendomatic
+from .status_console import StatusConsole
+from .display_process import SharedDisplay
+from .display_process import SharedDisplayReader
+
+
+class MultiRig(object):
+
+    """
+    Runs several rigs (ball, camera and trigger device) from one supervisor. Each rig's
+    control pipeline (FlyData, Protocol, H5Logger and TriggerDevice, i.e. a
+    FicTracVendomatic with its own redis channel, trigger device port and log file)
+    runs in its own worker process pinned to a cpu. The workers publish their state to
+    shared memory (see SharedDisplay) and the supervisor draws all rigs in one figure
+    (one axes per rig) and shows a status line per rig at status_rate on a 
+    StatusConsole (status_mode, the rigs themselves are quiet). In json mode each 
+    status is one object with keys <rig_name>_<field> and the rigs' own messages (e.g.
+    end of run summaries) are written to stderr so stdout only contains json.
+
+    The parameters in param apply to every rig and 'rigs' is a list of the per rig
+    parameters (e.g. redis_channel, trigger_device_port, logfile_name and optionally
+    rig_name and rig_cpu), which override them. If rig_cpu is not given the rigs are
+    distributed over the available cpus, leaving the first one for the supervisor.
+
+    """
+
+    default_param = {
+            'rigs': [],
+            'display': 'inline',
+            'display_rate': 20.0,
+            'status_mode': 'console',
+            'status_rate': 1.0,
+            }
+
+    Join_Timeout = 10.0
+    Unique_Keys = ('redis_channel', 'trigger_device_port', 'logfile_name')
+
+    def __init__(self, param=default_param):
+        self.param = param
+        if not self.param['rigs']:
+            raise(ValueError('no rigs given'))
+        base_param = dict(FicTracVendomatic.default_param)
+        base_param.update({k: v for k, v in self.param.items() if k != 'rigs'})
+
+        cpu_list = get_cpu_list()
+        self.rig_param_list = []
+        for i, rig_param in enumerate(self.param['rigs']):
+            rig_param = dict(base_param, **rig_param)
+            rig_param.setdefault('rig_name', 'rig{0}'.format(i))
+            if 'rig_cpu' not in rig_param and len(cpu_list) > 1:
+                rig_param['rig_cpu'] = cpu_list[1 + i % (len(cpu_list) - 1)]
+            rig_param['display'] = 'shared'
+            rig_param['status_mode'] = 'quiet'
+            rig_param['display_title'] = rig_param['rig_name']
+            self.rig_param_list.append(rig_param)
+        for key in self.Unique_Keys:
+            value_list = [p[key] for p in self.rig_param_list]
+            if len(set(value_list)) != len(value_list):
+                raise(ValueError('{0} must be different for every rig'.format(key)))
+
+        # Shared memory (owned by the supervisor) for each rig's state
+        self.shared_list = []
+        self.reader_list = []
+        for rig_param in self.rig_param_list:
+            shared = SharedDisplay(rig_param)
+            rig_param['display_shm_name'] = shared.shm.name
+            self.shared_list.append(shared)
+            self.reader_list.append(SharedDisplayReader(shared.shm.name, shared.capacity, rig_param))
+
+        # Start the workers before any gui is created (fork)
+        self.status_console = StatusConsole(self.param.get('status_mode', 'console'))
+        rig_stderr = self.status_console.mode == 'json'
+        if 'fork' in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context('fork')
+        else:
+            ctx = multiprocessing.get_context('spawn')
+        self.worker_list = []
+        for rig_param in self.rig_param_list:
+            worker = ctx.Process(target=rig_worker_main, args=(rig_param, rig_stderr))
+            worker.start()
+            self.worker_list.append(worker)
+
+        self.fig = None
+        self.display_list = []
+        display_type = self.param.get('display', 'inline')
+        if display_type == 'inline':
+            self.create_display()
+        elif display_type != 'none':
+            raise(ValueError('unknown display {0}, must be inline or none'.format(display_type)))
+
+        self.status_count = [0 for p in self.rig_param_list]
+        self.status_time = time.time()
+        self.done = False
+        signal.signal(signal.SIGINT, self.sigint_handler)
+
+    def create_display(self):
+        import matplotlib.pyplot as plt
+        from .basic_display import BasicDisplay
+        num_rigs = len(self.rig_param_list)
+        num_cols = int(math.ceil(math.sqrt(num_rigs)))
+        num_rows = int(math.ceil(num_rigs/float(num_cols)))
+        plt.ion()
+        self.fig, ax_array = plt.subplots(num_rows, num_cols, squeeze=False, num=1)
+        ax_list = list(ax_array.flat)
+        for ax in ax_list[num_rigs:]:
+            ax.set_visible(False)
+        for rig_param, ax in zip(self.rig_param_list, ax_list):
+            self.display_list.append(BasicDisplay(rig_param, ax=ax))
+
+    def run(self):
+        """
+        Supervisor loop - updates display at display_rate and status at status_rate
+        until ctl-c or all workers have exited.
+        """
+        display_dt = 1.0/self.param.get('display_rate', 20.0)
+        status_dt = 1.0/self.param.get('status_rate', 1.0)
+        time_status = time.time() + status_dt
+        while not self.done and any([worker.is_alive() for worker in self.worker_list]):
+            time_begin = time.time()
+            for i, reader in enumerate(self.reader_list):
+                if self.display_list:
+                    reader.update_display(self.display_list[i])
+                else:
+                    reader.read()
+            if time_begin >= time_status:
+                self.print_status()
+                time_status = max(time_status + status_dt, time.time())
+            time.sleep(max(display_dt - (time.time() - time_begin), 0.001))
+        self.clean_up()
+
+    def print_status(self):
+        if self.status_console.mode == 'quiet':
+            return
+        time_now = time.time()
+        dt = max(time_now - self.status_time, 1.0e-6)
+        self.status_time = time_now
+        is_json = self.status_console.mode == 'json'
+        status = []
+        if not is_json:
+            status.append(('rig', '{0:>8s} {1:>10s} {2:>8s} {3:>9s} {4:>9s} {5:>6s}'.format(
+                'state', 'frames', 'fps', 'pos x', 'pos y', 'stim')))
+        for i, (rig_param, reader, worker) in enumerate(zip(self.rig_param_list, self.reader_list, self.worker_list)):
+            count = reader.count
+            rate = max(count - self.status_count[i], 0)/dt
+            self.status_count[i] = count
+            rig_status = [
+                    ('state', 'running' if worker.is_alive() else 'exited'),
+                    ('frames', count),
+                    ('fps', rate),
+                    ('posx', reader.data.posx if reader.data.count else float('nan')),
+                    ('posy', reader.data.posy if reader.data.count else float('nan')),
+                    ('stim', 'on' if reader.stim_enabled else 'off'),
+                    ]
+            if is_json:
+                status.extend([('{0}_{1}'.format(rig_param['rig_name'], k), v) for k, v in rig_status])
+            else:
+                values = [v for k, v in rig_status]
+                status.append((rig_param['rig_name'], '{0:>8s} {1:10d} {2:8.1f} {3:9.3f} {4:9.3f} {5:>6s}'.format(*values)))
+        self.status_console.show(status)
+
+    def sigint_handler(self, signum, frame):
+        self.done = True
+
+    def clean_up(self):
+        message = self.status_console.message
+        message()
+        message('Run finished - stopping rigs!')
+        for worker in self.worker_list:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGINT)
+        for rig_param, worker in zip(self.rig_param_list, self.worker_list):
+            worker.join(self.Join_Timeout)
+            if worker.is_alive():
+                message('{0} did not stop - terminating'.format(rig_param['rig_name']))
+                worker.terminate()
+                worker.join()
+            elif worker.exitcode:
+                message('{0} exited with code {1}'.format(rig_param['rig_name'], worker.exitcode))
+        for display in self.display_list:
+            display.close()
+        if self.fig is not None:
+            import matplotlib.pyplot as plt
+            plt.close(self.fig)
+        for reader in self.reader_list:
+            reader.close()
+        for shared in self.shared_list:
+            shared.close()
+
+
+def get_cpu_list():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def rig_worker_main(param, use_stderr=False):
+    """
+    Entry point for a rig's worker process. If use_stderr is True the rig's output 
+    is written to stderr.
+    """
+    if use_stderr:
+        sys.stdout = sys.stderr
+    cpu = param.get('rig_cpu', None)
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {cpu})
+    client = FicTracVendomatic(param=param)
+    client.run()
@@ -0,0 +1,70 @@
+from __future__ import print_function
+
+import math
+
+import h5py
+import numpy
+
+from .log_reader import LogReader
+
+
+Default_Factors = (10, 100, 1000)
+Default_Chunk_Size = 100000
+
+
+def build_overview(filename, factors=Default_Factors, chunk_size=Default_Chunk_Size):
+    """
+    Adds multi-resolution overview levels to an H5Logger log file. For each factor
+    the min, max and mean of every numeric value over blocks of factor rows are
+    stored in datasets overview/<factor>/<stat>/<key> (the last block may be partial).
+    The file is read in chunks so the cost is one pass over the file. Existing levels
+    are replaced.
+    """
+    factors = sorted(set([int(f) for f in factors]))
+    if not factors:
+        return
+    lcm = 1
+    for factor in factors:
+        lcm = lcm*factor//math.gcd(lcm, factor)
+    chunk_size = lcm*max(1, int(math.ceil(chunk_size/float(lcm))))
+
+    reader = LogReader(filename)
+    num_rows = len(reader)
+    keys = [k for k in reader.keys if reader.get_dataset(k).dtype.kind in 'biuf']
+    level_dict = {}
+    for chunk in reader.iter_chunks(keys, chunk_size):
+        for factor in factors:
+            level = level_dict.setdefault(factor, {stat: {k: [] for k in keys} for stat in LogReader.Overview_Stats})
+            for key, values in chunk.items():
+                values = values.astype(numpy.float64)
+                num_full = (len(values)//factor)*factor
+                block_list = [values[:num_full].reshape((-1, factor) + values.shape[1:])]
+                if num_full < len(values):
+                    block_list.append(values[num_full:][numpy.newaxis]) # partial last block
+                for blocks in block_list:
+                    level['min'][key].append(blocks.min(axis=1))
+                    level['max'][key].append(blocks.max(axis=1))
+                    level['mean'][key].append(blocks.mean(axis=1))
+    reader.close()
+
+    with h5py.File(filename, 'r+') as h5file:
+        if LogReader.Overview_Group in h5file:
+            del h5file[LogReader.Overview_Group]
+        group = h5file.create_group(LogReader.Overview_Group)
+        group.attrs['num_rows'] = num_rows
+        for factor, level in level_dict.items():
+            level_group = group.create_group(str(factor))
+            for stat, stat_dict in level.items():
+                stat_group = level_group.create_group(stat)
+                for key, block_list in stat_dict.items():
+                    stat_group.create_dataset(key, data=numpy.concatenate(block_list))
+
+
+def choose_overview_factor(factor_list, num_rows, max_points):
+    """
+    Returns the largest (coarsest) factor which still gives at least max_points points
+    for num_rows rows, or 1 (the full resolution data) if none does.
+    """
+    factor_ok = [f for f in factor_list if num_rows//f >= max_points]
+    return max(factor_ok) if factor_ok else 1
+
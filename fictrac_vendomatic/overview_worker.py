@@ -0,0 +1,11 @@
+"""
+Builds the overview levels of a closed log file. Run by H5Logger in a background
+process as: python -m fictrac_vendomatic.overview_worker filename [factor ...]
+"""
+import sys
+from .overview import build_overview
+from .overview import Default_Factors
+
+
+if __name__ == '__main__':
+    build_overview(sys.argv[1], [int(f) for f in sys.argv[2:]] or Default_Factors)
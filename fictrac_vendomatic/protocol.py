@@ -1,4 +1,5 @@
 from __future__ import print_function
+import numpy
 from . import utils
 
 
@@ -44,6 +45,9 @@ class Protocol(object):
         self.stim_x = 0.0
         self.stim_y = 0.0
 
+        self.window_distance = 0.0
+        self.window_distance_key = None
+
 
     def update(self,t,data):
         if self.is_first_update:
@@ -113,23 +117,54 @@ class Protocol(object):
             self.reset()
 
     def get_window_distance(self,t,data):
-        n = max([len(data.time_list)-1,0])
-        if n > 0:
-            done = False
-            while not done: 
-                test0 = (t - data.time_list[n]) >= self.param['stim_threshold_window']
-                test1 = (data.time_list[n] - self.time_start) <= self.param['stim_startup_delay']
-                if test0 or test1 or n==0:
-                    done = True
-                else:
-                    n -= 1
+        """
+        Returns distance between the current position and the position at the start of 
+        the threshold window (or at the end of the startup delay if that is later). The 
+        window start is found via binary search over the (monotonic) time buffer and the 
+        result is memoized so repeated calls for the same sample are free. 
+        """
+        cache_key = (t, data.count, self.time_start)
+        if cache_key == self.window_distance_key:
+            return self.window_distance
+        time_array = data.time_list
+        if len(time_array) > 1:
+            t_window = t - self.param['stim_threshold_window']
+            t_startup = self.time_start + self.param['stim_startup_delay']
+            n = numpy.searchsorted(time_array, max(t_window, t_startup), side='right') - 1
+            n = min(max(n, 0), len(time_array) - 1)
             p = data.posx, data.posy
             q = data.posx_list[n], data.posy_list[n]
-            return utils.distance(p,q)
+            window_distance = utils.distance(p,q)
         else:
-            return 0.0
+            window_distance = 0.0
+        self.window_distance_key = cache_key
+        self.window_distance = window_distance
+        return window_distance
 
 
+    def get_log_data(self,t,data):
+        """
+        Returns dict of the values logged (by the H5Logger) for each sample.
+        """
+        log_data = { 
+                'time': t,
+                'frame': data.frame,
+                'posx': data.posx,
+                'posy': data.posy,
+                'velx': data.velx,
+                'vely': data.vely,
+                'path_len': data.path_len,
+                'ready': int(self.ready),
+                'win_dist': self.get_window_distance(t, data),
+                'active': int(self.active),
+                'outside_dt': t - self.time_outer_circle,
+                'pulse_on': int(self.pulse_on),
+                'pulse_on_dt': t - self.time_pulse_on,
+                'stimx': self.stim_x,
+                'stimy': self.stim_y,
+                }
+        return log_data
+
     def is_inside_inner_circle(self,data):
         value = utils.is_inside_circle(
                 data.posx, 
@@ -0,0 +1,206 @@
+from __future__ import print_function
+
+import os
+import time
+
+import h5py
+import numpy
+
+from . import utils
+from .fly_data import FlyData
+from .protocol import Protocol
+from .h5_logger import H5Logger
+
+
+class Replay(object):
+
+    """
+    Re-runs the experimental protocol on recorded trajectories. Samples are streamed
+    through FlyData and Protocol using the recorded timestamps as the clock - there is
+    no redis, display or trigger device - so sessions replay as fast as the cpu allows.
+
+    run returns the per-sample protocol timelines (same keys as the H5Logger output)
+    and can optionally write them to a log file with the same schema as a live run.
+
+    """
+
+    Int_Keys = ('frame', 'ready', 'active', 'pulse_on') # other log values are float64
+
+    def __init__(self, param):
+        self.param = param
+        self.data = FlyData(self.param)
+        self.protocol = Protocol(self.param)
+
+    def reset(self):
+        self.data.reset()
+        self.protocol.reset()
+
+    def run(self, traj, logfile_name=None):
+        """
+        Replays trajectory traj (dict of arrays, see load_trajectory). A decrease in
+        time is treated as a reset message (as sent by FicTrac at restart).
+        """
+        logger = None
+        if logfile_name is not None:
+            logger = H5Logger(
+                    filename = logfile_name,
+                    param_attr = self.param,
+                    chunk_size = self.param.get('logfile_chunk_size', H5Logger.Default_Chunk_Size),
+                    flush_dt = None,
+                    compound = self.param.get('logfile_compound', False),
+                    )
+        self.reset()
+
+        num = len(traj['time'])
+        result = None
+        time_log = None
+        t_last = None
+
+        sample_list = zip(
+                traj['time'].tolist(),
+                traj['frame'].tolist(),
+                traj['posx'].tolist(),
+                traj['posy'].tolist(),
+                traj['velx'].tolist(),
+                traj['vely'].tolist(),
+                traj['heading'].tolist(),
+                )
+
+        for i, (t, frame, posx, posy, velx, vely, heading) in enumerate(sample_list):
+            if t_last is not None and t < t_last:
+                self.reset()
+                time_log = None
+            t_last = t
+            sample = {
+                    'type': 'data',
+                    'frame': frame,
+                    'posx': posx,
+                    'posy': posy,
+                    'velx': velx,
+                    'vely': vely,
+                    'heading': heading,
+                    }
+            self.data.add(t, sample)
+            self.protocol.update(t, self.data)
+            log_data = self.protocol.get_log_data(t, self.data)
+
+            if result is None:
+                result = {k: numpy.zeros((num,), dtype=numpy.int64 if k in self.Int_Keys else numpy.float64) for k in log_data}
+            for k, v in log_data.items():
+                result[k][i] = v
+
+            if logger is not None:
+                if time_log is None or (t - time_log) > self.param['logfile_dt']:
+                    time_log = t
+                    logger.add(log_data)
+
+        if logger is not None:
+            logger.reset()
+        return result
+
+
+def load_trajectory(filename, ball_radius=1.0, fly=0):
+    """
+    Loads a trajectory from an H5Logger log file, from a multi-fly file written by
+    BatchRandomFly.write_h5 (the trajectory of fly number fly) or from a FicTrac .dat 
+    file. Returns a dict of arrays with keys time, frame, posx, posy, velx, vely and 
+    heading.
+
+    Positions in H5Logger files are already scaled by the ball radius. Positions in
+    FicTrac .dat files are in radians and are scaled by ball_radius.
+    """
+    if os.path.splitext(filename)[1] == '.dat':
+        return load_dat_trajectory(filename, ball_radius)
+    else:
+        return load_h5_trajectory(filename, fly=fly)
+
+
+def load_h5_trajectory(filename, fly=0):
+    traj = {}
+    with h5py.File(filename, 'r') as h5file:
+        if H5Logger.Compound_Dataset_Name in h5file:
+            dataset = h5file[H5Logger.Compound_Dataset_Name][...]
+            get_values = lambda key: dataset[key]
+            names = dataset.dtype.names
+        elif 'num_flies' in h5file.attrs:
+            # BatchRandomFly file - datasets of shape (num_flies, num_steps) 
+            get_values = lambda key: h5file[key][fly] if h5file[key].ndim == 2 else h5file[key][...]
+            names = list(h5file.keys())
+        else:
+            get_values = lambda key: h5file[key][...]
+            names = list(h5file.keys())
+        for key in ('time', 'frame', 'posx', 'posy', 'velx', 'vely'):
+            traj[key] = numpy.asarray(get_values(key)).reshape(-1)
+        if 'heading' in names:
+            traj['heading'] = numpy.asarray(get_values('heading')).reshape(-1)
+        else:
+            traj['heading'] = numpy.zeros_like(traj['posx'])
+        if 'num_rows' in h5file.attrs:
+            # Preallocated file (e.g. segment of a crashed session) 
+            num_rows = int(h5file.attrs['num_rows'])
+            traj = {k: v[:num_rows] for k, v in traj.items()}
+    return traj
+
+
+# Column indices in FicTrac .dat files
+Dat_Col_Frame = 0
+Dat_Col_Posx = 14
+Dat_Col_Posy = 15
+Dat_Col_Heading = 16
+Dat_Col_Timestamp = 21
+
+
+def load_dat_trajectory(filename, ball_radius=1.0):
+    vals = numpy.loadtxt(filename, delimiter=',', ndmin=2)
+    t = vals[:,Dat_Col_Timestamp]*1.0e-3  # ms -> s
+    traj = {
+            'time': t - t[0],
+            'frame': vals[:,Dat_Col_Frame].astype(numpy.int64),
+            'posx': ball_radius*vals[:,Dat_Col_Posx],
+            'posy': ball_radius*vals[:,Dat_Col_Posy],
+            'heading': numpy.rad2deg(vals[:,Dat_Col_Heading]),
+            }
+    if len(t) > 1:
+        traj['velx'] = numpy.gradient(traj['posx'], traj['time'])
+        traj['vely'] = numpy.gradient(traj['posy'], traj['time'])
+    else:
+        traj['velx'] = numpy.zeros_like(traj['posx'])
+        traj['vely'] = numpy.zeros_like(traj['posy'])
+    return traj
+
+
+def replay_files(filename_list, param, output_filename=None, ball_radius=1.0):
+    """
+    Replays each file in filename_list, printing a short summary for each. When
+    output_filename is given the replayed logs are written to auto-incremented
+    files based on it.
+    """
+    replay = Replay(param)
+    output_logger = None
+    if output_filename is not None:
+        output_logger = H5Logger(filename=output_filename, auto_incr=True)
+    result_list = []
+    for filename in filename_list:
+        traj = load_trajectory(filename, ball_radius=ball_radius)
+        logfile_name = None
+        if output_logger is not None:
+            logfile_name = output_logger.get_next_filename()
+        time_begin = time.time()
+        result = replay.run(traj, logfile_name=logfile_name)
+        time_run = time.time() - time_begin
+        result_list.append(result)
+        num = len(traj['time'])
+        if num > 0:
+            duration = traj['time'][-1] - traj['time'][0]
+            num_pulses = int(numpy.sum(numpy.diff(result['pulse_on']) > 0) + result['pulse_on'][0])
+        else:
+            duration = 0.0
+            num_pulses = 0
+        utils.flush_print(filename)
+        utils.flush_print('  samples     = {0}'.format(num))
+        utils.flush_print('  duration    = {0:1.3f}'.format(duration))
+        utils.flush_print('  pulses      = {0}'.format(num_pulses))
+        utils.flush_print('  run time    = {0:1.3f}'.format(time_run))
+        if logfile_name is not None:
+            utils.flush_print('  output      = {0}'.format(logfile_name))
+    return result_list
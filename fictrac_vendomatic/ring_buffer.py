@@ -0,0 +1,77 @@
+import numpy
+
+
+class RingBuffer(object):
+
+    """
+    Fixed capacity, array backed circular buffer holding one or more named fields.
+
+    Every value is written twice, at index i and at index i + capacity, so that the
+    window of live samples is always a contiguous slice of the backing array. This
+    gives O(1) append and eviction and lets consumers take zero-copy views of the
+    data. Note, views share memory with the buffer and are only valid until the
+    next call to append.
+
+    """
+
+    def __init__(self, capacity, fields, dtype=numpy.float64):
+        if capacity < 1:
+            raise(ValueError('capacity must be >= 1'))
+        self.capacity = int(capacity)
+        self.fields = tuple(fields)
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+        self.buf = numpy.zeros((len(self.fields), 2*self.capacity), dtype=dtype)
+        self.clear()
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def is_full(self):
+        return self.size == self.capacity
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+
+    def append(self, *values):
+        """
+        Append one sample (values given in field order). Overwrites the oldest
+        sample when the buffer is full.
+        """
+        ind = self.start + self.size
+        if ind >= self.capacity:
+            ind -= self.capacity
+        self.buf[:,ind] = values
+        self.buf[:,ind + self.capacity] = values
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start += 1
+            if self.start == self.capacity:
+                self.start = 0
+
+    def popleft(self, num=1):
+        """
+        Remove the num oldest samples from the buffer.
+        """
+        num = min(num, self.size)
+        self.start = (self.start + num) % self.capacity
+        self.size -= num
+
+    def view(self, name):
+        """
+        Returns a contiguous (zero-copy) view of the live samples for field name,
+        ordered oldest to newest.
+        """
+        return self.buf[self.field_index[name], self.start:self.start + self.size]
+
+    def first(self, name):
+        return self.buf[self.field_index[name], self.start]
+
+    def last(self, name):
+        return self.buf[self.field_index[name], self.start + self.size - 1]
+
+    def __getitem__(self, name):
+        return self.view(name)
+
@@ -0,0 +1,90 @@
+from __future__ import print_function
+import sys
+import json
+import math
+
+
+class StatusConsole(object):
+
+    """
+    Shows a status summary (list of (name, value) pairs) on the terminal. The caller
+    decides when to call show - at status_rate, not per frame - so the cost is
+    independent of the message rate.
+
+    mode 'console' redraws the summary in place (on a terminal, otherwise each
+    summary is printed as a new block), 'json' writes one json object per line (for
+    piping to other programs, nan values are written as null) and 'quiet' shows 
+    nothing. Other output (e.g. end of run summaries) should be written with message
+    so that in json mode the stream only contains json objects.
+
+    """
+
+    Mode_List = ('console', 'json', 'quiet')
+    Default_Rate = 5.0
+
+    def __init__(self, mode='console', stream=None):
+        if mode not in self.Mode_List:
+            raise(ValueError('unknown status mode {0}, must be one of {1}'.format(mode, self.Mode_List)))
+        self.mode = mode
+        self.stream = stream if stream is not None else sys.stdout
+        self.in_place = self.mode == 'console' and self.stream.isatty()
+        self.num_lines = 0
+
+    def show(self, status):
+        if self.mode == 'quiet':
+            return
+        if self.mode == 'json':
+            status = {name: json_value(value) for name, value in status}
+            self.stream.write(json.dumps(status, allow_nan=False) + '\n')
+        else:
+            line_list = ['{0:14s}= {1}'.format(name, format_value(value)) for name, value in status]
+            text = ''
+            if self.in_place:
+                # Move to start of the previous summary and clear each line as rewritten
+                if self.num_lines:
+                    text += '\x1b[{0}F'.format(self.num_lines)
+                text += ''.join(['\x1b[K{0}\n'.format(line) for line in line_list])
+            else:
+                text += '\n'.join(line_list) + '\n\n'
+            self.num_lines = len(line_list)
+            self.stream.write(text)
+        self.stream.flush()
+
+    def message(self, text=''):
+        """
+        Writes a line of text - as {"message": text} in json mode (blank lines are 
+        skipped) and below the current summary otherwise (also in quiet mode).
+        """
+        if self.mode == 'json':
+            if not text:
+                return
+            self.stream.write(json.dumps({'message': text}) + '\n')
+        else:
+            self.stream.write(text + '\n')
+            self.num_lines = 0
+        self.stream.flush()
+
+    def reset(self):
+        """
+        Starts a new summary below the current one (e.g. after other output).
+        """
+        self.num_lines = 0
+
+
+def json_value(value):
+    # numpy scalars
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def format_value(value):
+    if value is None:
+        return '---'
+    if isinstance(value, float):
+        return '{0:1.3f}'.format(value)
+    return str(value)
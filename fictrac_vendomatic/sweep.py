@@ -0,0 +1,164 @@
+from __future__ import print_function
+
+import os
+import csv
+import json
+import hashlib
+import itertools
+import concurrent.futures
+
+import numpy
+
+from . import utils
+from .replay import Replay
+from .replay import load_trajectory
+
+
+Summary_Keys = ('num_samples', 'num_pulses', 'time_to_activation', 'num_resets', 'inner_dwell_time')
+
+
+def param_grid(grid):
+    """
+    Returns list of parameter dicts for every combination of the values in grid (a
+    dict of parameter name -> list of values).
+    """
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*[grid[k] for k in keys])]
+
+
+def file_hash(filename, block_size=2**20):
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def param_hash(param):
+    jsonparam = json.dumps(param, sort_keys=True, default=str)
+    return hashlib.sha1(jsonparam.encode()).hexdigest()
+
+
+def summarize(result, param):
+    """
+    Computes summary of replay result (per sample protocol timelines): number of
+    pulses, time to first activation, number of protocol resets and time spent inside
+    the inner stimulus circle while the protocol was active.
+    """
+    num = len(result['time'])
+    summary = {
+            'num_samples': num,
+            'num_pulses': 0,
+            'time_to_activation': float('nan'),
+            'num_resets': 0,
+            'inner_dwell_time': 0.0,
+            }
+    if num == 0:
+        return summary
+    pulse_on = result['pulse_on'].astype(bool)
+    active = result['active'].astype(bool)
+    ready = result['ready'].astype(bool)
+    summary['num_pulses'] = int(pulse_on[0]) + int(numpy.sum(pulse_on[1:] & ~pulse_on[:-1]))
+    summary['num_resets'] = int(numpy.sum(ready[:-1] & ~ready[1:]))
+    active_ind = numpy.flatnonzero(active)
+    if len(active_ind) > 0:
+        summary['time_to_activation'] = float(result['time'][active_ind[0]] - result['time'][0])
+    if num > 1:
+        dt = numpy.diff(result['time'])
+        dist = numpy.hypot(result['posx'] - result['stimx'], result['posy'] - result['stimy'])
+        inside = active & (dist <= param['stim_inner_radius'])
+        summary['inner_dwell_time'] = float(numpy.sum(dt[inside[:-1] & (dt > 0)]))
+    return summary
+
+
+# Trajectories loaded by the current worker process, so each is only read once
+worker_traj_cache = {}
+
+def run_cell(filename, param, ball_radius=1.0):
+    """
+    Replays one file with one parameter set and returns its summary. Called in
+    worker processes.
+    """
+    traj_key = (filename, ball_radius)
+    if traj_key not in worker_traj_cache:
+        worker_traj_cache.clear()
+        worker_traj_cache[traj_key] = load_trajectory(filename, ball_radius=ball_radius)
+    traj = worker_traj_cache[traj_key]
+    result = Replay(param).run(traj)
+    return summarize(result, param)
+
+
+class Sweep(object):
+
+    """
+    Evaluates every combination of parameter set and recorded trajectory with a pool
+    of worker processes (one per core by default) and returns a summary table.
+
+    Results are cached in a json file keyed by (file hash, parameter hash, ball 
+    radius) so that re-runs only compute new cells. The cache is saved as each cell 
+    completes so an interrupted sweep keeps the cells already computed.
+
+    """
+
+    def __init__(self, base_param, grid, cache_filename=None, max_workers=None, ball_radius=1.0):
+        self.base_param = base_param
+        self.grid = grid
+        self.cache_filename = cache_filename
+        self.max_workers = max_workers
+        self.ball_radius = ball_radius
+        self.cache = {}
+        if self.cache_filename is not None and os.path.exists(self.cache_filename):
+            with open(self.cache_filename, 'r') as f:
+                self.cache = json.load(f)
+
+    def save_cache(self):
+        if self.cache_filename is not None:
+            tmp_filename = self.cache_filename + '.tmp'
+            with open(tmp_filename, 'w') as f:
+                json.dump(self.cache, f, indent=2, sort_keys=True)
+            os.replace(tmp_filename, self.cache_filename)
+
+    def run(self, filename_list):
+        override_list = param_grid(self.grid)
+        hash_dict = {filename: file_hash(filename) for filename in filename_list}
+
+        cell_list = []
+        for filename in filename_list:
+            for override in override_list:
+                param = dict(self.base_param)
+                param.update(override)
+                cache_key = '{0}:{1}:{2}'.format(hash_dict[filename], param_hash(param), self.ball_radius)
+                cell_list.append((filename, override, param, cache_key))
+
+        # Compute cells missing from the cache - ordered by file so workers can reuse
+        # loaded trajectories
+        todo_list = [cell for cell in cell_list if cell[3] not in self.cache]
+        utils.flush_print('sweep: {0} cells, {1} cached, {2} to compute'.format(
+            len(cell_list), len(cell_list) - len(todo_list), len(todo_list)))
+        if todo_list:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                future_dict = {}
+                for filename, override, param, cache_key in todo_list:
+                    future = executor.submit(run_cell, filename, param, self.ball_radius)
+                    future_dict[future] = cache_key
+                for future in concurrent.futures.as_completed(future_dict):
+                    self.cache[future_dict[future]] = future.result()
+                    self.save_cache()
+
+        table = []
+        for filename, override, param, cache_key in cell_list:
+            row = {'file': filename}
+            row.update(override)
+            row.update(self.cache[cache_key])
+            table.append(row)
+        return table
+
+
+def write_table(table, filename):
+    if not table:
+        return
+    fieldnames = list(table[0].keys())
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(table)
@@ -1,7 +1,13 @@
 from __future__ import print_function
 import time
+import queue
+import threading
+import collections
 import serial
 
+from . import utils
+from .latency import LatencyHistogram
+
 
 class TriggerDevice(serial.Serial):
 
@@ -11,22 +17,165 @@ class TriggerDevice(serial.Serial):
     CmdSetTriggerLow = 0
     CmdSetTriggerHigh = 1
 
-    def __init__(self,port,timeout=10.0):
+    def __init__(self,port,timeout=10.0,reset_sleep_dt=ResetSleepDt):
         param = {'baudrate': self.Baudrate, 'timeout': timeout}
         super(TriggerDevice,self).__init__(port,**param)
-        time.sleep(self.ResetSleepDt)
+        time.sleep(reset_sleep_dt)
         self.is_high = None
         self.set_low();
 
     def set_low(self):
+        """
+        Sets trigger low, returns True if a command was written (state changed).
+        """
         if (self.is_high is None) or self.is_high:
             self.write('[{0}]\n'.format(self.CmdSetTriggerLow).encode())
             self.is_high = False
+            return True
+        return False
 
     def set_high(self):
+        """
+        Sets trigger high, returns True if a command was written (state changed).
+        """
         if (self.is_high is None) or not self.is_high:
             self.write('[{0}]\n'.format(self.CmdSetTriggerHigh).encode())
             self.is_high = True
+            return True
+        return False
+
+
+class AsyncTriggerDevice(object):
+
+    """
+    Non-blocking trigger device. The serial port is owned by a dedicated thread: 
+    set_high/set_low only hand the command to the thread (via a queue) and return
+    immediately. The thread writes the commands and continuously reads and parses the 
+    firmware's replies so the device's output never backs up. The firmware echoes 
+    every command it reads, which acknowledges the command (the round trip time is 
+    accumulated in a histogram), but prints "Trigger LOW"/"Trigger HIGH" only once per
+    loop pass, for the last command read in that pass, so these lines only update the
+    trigger state reported by the device (device_is_high).
+
+    If the io thread fails (e.g. the serial device is disconnected) the error is kept
+    and raised, as a RuntimeError, by the next call to set_high, set_low or close.
+
+    """
+
+    Poll_Dt = 0.001
+    Join_Timeout = 5.0
+    Ack_Dict = {b'Trigger LOW': TriggerDevice.CmdSetTriggerLow, b'Trigger HIGH': TriggerDevice.CmdSetTriggerHigh}
+
+    def __init__(self,port,timeout=10.0,reset_sleep_dt=TriggerDevice.ResetSleepDt):
+        self.device = TriggerDevice(port,timeout=timeout,reset_sleep_dt=reset_sleep_dt)
+        self.device.timeout = 0 # non-blocking reads in the io thread
+        self.is_high = self.device.is_high
+        self.cmd_queue = queue.SimpleQueue()
+        self.pending = collections.deque()
+        self.pending.append((TriggerDevice.CmdSetTriggerLow, None)) # sent by TriggerDevice.__init__ 
+        self.read_buf = b''
+        self.device_is_high = None
+        self.error = None
+        self.num_sent = 1 # command sent by TriggerDevice.__init__
+        self.num_acked = 0
+        self.num_mismatch = 0
+        self.rtt_hist = LatencyHistogram()
+        self.done = False
+        self.io_thread = threading.Thread(target=self.io_loop)
+        self.io_thread.daemon = True
+        self.io_thread.start()
+
+    def set_low(self):
+        self.check_io()
+        if (self.is_high is None) or self.is_high:
+            self.cmd_queue.put(TriggerDevice.CmdSetTriggerLow)
+            self.is_high = False
+            return True
+        return False
+
+    def set_high(self):
+        self.check_io()
+        if (self.is_high is None) or not self.is_high:
+            self.cmd_queue.put(TriggerDevice.CmdSetTriggerHigh)
+            self.is_high = True
+            return True
+        return False
+
+    def isOpen(self):
+        return self.device.isOpen()
+
+    def close(self):
+        """
+        Waits for queued commands to be written (and acknowledged), then closes port.
+        """
+        self.done = True
+        self.io_thread.join(self.Join_Timeout)
+        self.device.close()
+        self.check_io()
+
+    def check_io(self):
+        if self.error is not None:
+            raise(RuntimeError('trigger device io failed: {0!r}'.format(self.error)))
+
+    def io_loop(self):
+        try:
+            self.run_io()
+        except Exception as err:
+            self.error = err
+
+    def run_io(self):
+        while True:
+            try:
+                cmd = self.cmd_queue.get(timeout=self.Poll_Dt)
+            except queue.Empty:
+                cmd = None
+            if cmd is not None:
+                self.device.write('[{0}]\n'.format(cmd).encode())
+                self.pending.append((cmd, time.time()))
+                self.num_sent += 1
+            self.read_replies()
+            if self.done and cmd is None and self.cmd_queue.empty():
+                # Drain outstanding acknowledgements before exiting
+                time_end = time.time() + self.Join_Timeout
+                while self.pending and time.time() < time_end:
+                    time.sleep(self.Poll_Dt)
+                    self.read_replies()
+                break
+
+    def read_replies(self):
+        num_waiting = self.device.in_waiting
+        if not num_waiting:
+            return
+        self.read_buf += self.device.read(num_waiting)
+        *line_list, self.read_buf = self.read_buf.split(b'\n')
+        for line in line_list:
+            line = line.strip()
+            if line in self.Ack_Dict:
+                self.device_is_high = self.Ack_Dict[line] == TriggerDevice.CmdSetTriggerHigh
+                continue
+            try:
+                cmd_echo = int(line)
+            except ValueError:
+                continue
+            if not self.pending:
+                self.num_mismatch += 1
+                continue
+            cmd, time_write = self.pending.popleft()
+            if cmd == cmd_echo:
+                self.num_acked += 1
+                if time_write is not None:
+                    self.rtt_hist.add(time.time() - time_write)
+            else:
+                self.num_mismatch += 1
+
+    def print_summary(self, print_func=utils.flush_print):
+        hist = self.rtt_hist
+        print_func()
+        print_func('trigger commands sent = {0}, acknowledged = {1}, mismatched = {2}'.format(
+            self.num_sent, self.num_acked, self.num_mismatch))
+        if hist.count:
+            print_func('trigger round trip (ms): mean = {0:1.3f}, p50 = {1:1.3f}, p99 = {2:1.3f}, max = {3:1.3f}'.format(
+                1.0e3*hist.mean, 1.0e3*hist.percentile(50), 1.0e3*hist.percentile(99), 1.0e3*hist.max))
 
 
 # ------------------------------------------------------------------------------
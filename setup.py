@@ -29,5 +29,5 @@ setup(
     ],
 
     packages=find_packages(exclude=['examples', 'bin', 'pulse_firmware']),
-    scripts=['bin/vendomatic', 'bin/fake-fictrac']
+    scripts=['bin/vendomatic', 'bin/fake-fictrac', 'bin/replay', 'bin/sweep', 'bin/vendomatic-benchmark', 'bin/fake-trigger-device', 'bin/vendomatic-multi-rig', 'bin/random-flies', 'bin/log-overview']
 )
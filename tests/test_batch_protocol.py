@@ -0,0 +1,43 @@
+import random
+
+import numpy
+import pytest
+
+from fictrac_vendomatic import FicTracVendomatic
+from fictrac_vendomatic import RandomFly
+from fictrac_vendomatic.batch_protocol import check_batch_protocol
+
+
+Num_Samples = 20000
+Dt = 0.01
+
+Param_List = [
+        {},
+        {'stim_threshold_window': 1.0, 'stim_threshold_distance': 1.0, 'protocol_reset_window': 2.0},
+        {'stim_threshold_window': 20.0, 'stim_threshold_distance': 2.0},
+        {'stim_pulse_on_window': 0.05, 'stim_pulse_off_window': 0.0},
+        {'stim_inner_radius': 0.3, 'stim_outer_radius': 0.6, 'protocol_reset_window': 0.5},
+        {'path_window': 3.0, 'path_buffer_size': 50},
+        ]
+
+
+def random_trajectory(seed):
+    random.seed(seed)
+    fly = RandomFly(Dt)
+    traj = {k: numpy.zeros((Num_Samples,)) for k in ('time', 'posx', 'posy', 'velx', 'vely', 'heading')}
+    traj['frame'] = numpy.arange(Num_Samples)
+    for i in range(Num_Samples):
+        fly.update()
+        traj['time'][i] = i*Dt
+        traj['posx'][i] = fly.posx
+        traj['posy'][i] = fly.posy
+    return traj
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('param_update', Param_List)
+def test_batch_protocol_matches_protocol(seed, param_update):
+    param = dict(FicTracVendomatic.default_param)
+    param.update(param_update)
+    mismatch = check_batch_protocol(random_trajectory(seed), param)
+    assert not any(mismatch.values()), mismatch
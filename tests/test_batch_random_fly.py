@@ -0,0 +1,23 @@
+import numpy
+
+from fictrac_vendomatic.batch_random_fly import BatchRandomFly
+
+
+def test_speed_paths_match():
+    fly = BatchRandomFly(BatchRandomFly.Max_Flies_Scalar + 1, 0.01, seed=1)
+    fly.speed = numpy.linspace(0.0, 2.0, fly.num_flies)
+    rand_speed = numpy.random.default_rng(2).random((1000, fly.num_flies))
+    speed_scalar = numpy.empty_like(rand_speed)
+    speed_vector = numpy.empty_like(rand_speed)
+    fly.update_speed_scalar(rand_speed, speed_scalar)
+    fly.update_speed_vector(rand_speed, speed_vector)
+    assert numpy.array_equal(speed_scalar, speed_vector)
+
+
+def test_chunk_size():
+    result = BatchRandomFly(3, 0.01, seed=5).run(3000)
+    chunk_list = list(BatchRandomFly(3, 0.01, seed=5).run_chunks(3000, 700))
+    for key, values in result.items():
+        values_chunked = numpy.concatenate([c[key] for c in chunk_list], axis=-1)
+        assert values_chunked.shape == values.shape
+        assert numpy.allclose(values_chunked, values, atol=1.0e-9)
@@ -0,0 +1,106 @@
+import h5py
+import numpy
+import pytest
+
+from fictrac_vendomatic.h5_logger import H5Logger
+from fictrac_vendomatic.log_reader import LogReader
+
+
+Num_Rows = 2500
+
+
+def get_row(i):
+    return {
+            'time': 0.01*i, 
+            'frame': i, 
+            'posx': numpy.cos(0.01*i), 
+            'posy': numpy.sin(0.01*i),
+            'pulse_on': int(i%7 == 0),
+            }
+
+
+def write_log(filename, **kwargs):
+    logger = H5Logger(filename, **kwargs)
+    for i in range(Num_Rows):
+        logger.add(get_row(i))
+    logger.close()
+
+
+def check_values(filename, atol=0.0):
+    with LogReader(filename) as reader:
+        assert len(reader) == Num_Rows
+        data = reader.read()
+    for key in get_row(0):
+        expected = numpy.array([get_row(i)[key] for i in range(Num_Rows)])
+        numpy.testing.assert_allclose(data[key], expected, atol=atol)
+    return data
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'compression': 'gzip'},
+    {'compression': 'gzip', 'compression_opts': 9, 'shuffle': True},
+    {'compression': 'lzf', 'shuffle': True},
+    {'compression': 'lzf', 'compression_opts': 4},
+    {'compression': ('gzip', 1)},
+    {'compression': {'posx': ('gzip', 4), 'pulse_on': 'lzf'}, 'compression_opts': 9},
+    {'compression': ['gzip', 2], 'compound': True},
+    {'compression': 'gzip', 'shuffle': True, 'swmr': True},
+    {'shuffle': True},
+    ])
+def test_compression(tmp_path, kwargs):
+    filename = str(tmp_path/'log.hdf5')
+    write_log(filename, **kwargs)
+    check_values(filename)
+
+
+def test_per_dataset_compression(tmp_path):
+    filename = str(tmp_path/'log.hdf5')
+    write_log(filename, compression={'posx': ('gzip', 4), 'pulse_on': 'lzf'}, compression_opts=9)
+    with h5py.File(filename, 'r') as h5file:
+        assert h5file['posx'].compression == 'gzip'
+        assert h5file['posx'].compression_opts == 4
+        assert h5file['pulse_on'].compression == 'lzf'
+        assert h5file['posy'].compression is None
+
+
+def test_dtypes(tmp_path):
+    filename = str(tmp_path/'log.hdf5')
+    write_log(filename, dtypes='compact', compression='gzip', shuffle=True)
+    data = check_values(filename, atol=1.0e-6)
+    assert data['time'].dtype == numpy.float64
+    assert data['posx'].dtype == numpy.float32
+    assert data['pulse_on'].dtype == numpy.int8
+    assert data['frame'].dtype == numpy.int32
+
+    filename = str(tmp_path/'log_compound.hdf5')
+    write_log(filename, dtypes={'pulse_on': 'int8'}, compound=True)
+    data = check_values(filename)
+    assert data['pulse_on'].dtype == numpy.int8
+    assert data['posx'].dtype == numpy.float64
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'compression': 'zstd'},
+    {'compression': 'gzip', 'compression_opts': 12},
+    {'compression': {'posx': ('gzip', -1)}},
+    {'compression': ('gzip', 4, 1)},
+    {'compression': {'posx': 'gzip'}, 'compound': True},
+    {'dtypes': 'small'},
+    ])
+def test_invalid_options(tmp_path, kwargs):
+    with pytest.raises(ValueError):
+        H5Logger(str(tmp_path/'log.hdf5'), **kwargs)
+
+
+def test_overview_levels(tmp_path):
+    filename = str(tmp_path/'log.hdf5')
+    write_log(filename, overview_factors=[10, 100])
+    with LogReader(filename) as reader:
+        assert reader.overview_factors == [10, 100]
+    check_values(filename)
+
+
+def test_overview_failure(tmp_path):
+    with pytest.raises(RuntimeError):
+        write_log(str(tmp_path/'log.hdf5'), overview_factors=[0])
@@ -0,0 +1,49 @@
+import numpy
+
+from fictrac_vendomatic.h5_logger import H5Logger
+from fictrac_vendomatic.log_reader import LogReader
+from fictrac_vendomatic.overview import build_overview
+from fictrac_vendomatic.overview import choose_overview_factor
+
+
+def test_choose_overview_factor():
+    factor_list = [10, 100, 1000]
+    max_points = 1280
+    assert choose_overview_factor(factor_list, 1000, max_points) == 1
+    assert choose_overview_factor(factor_list, 2000, max_points) == 1
+    assert choose_overview_factor(factor_list, 20000, max_points) == 10
+    assert choose_overview_factor(factor_list, 200000, max_points) == 100
+    assert choose_overview_factor(factor_list, 2000000, max_points) == 1000
+    assert choose_overview_factor([], 2000000, max_points) == 1
+    for num_rows in (2000, 20000, 200000, 2000000):
+        factor = choose_overview_factor(factor_list, num_rows, max_points)
+        assert num_rows//factor >= max_points or factor == 1
+
+
+def write_log(filename, num_rows, compound=False):
+    logger = H5Logger(filename, compound=compound)
+    for i in range(num_rows):
+        logger.add({'time': 0.01*i, 'posx': numpy.sin(0.01*i), 'pulse_on': int(i%37 == 0)})
+    logger.close()
+
+
+def test_build_overview(tmp_path):
+    for compound in (False, True):
+        filename = str(tmp_path/'log_{0}.hdf5'.format(compound))
+        num_rows = 1234
+        write_log(filename, num_rows, compound)
+        build_overview(filename, [10, 100])
+        with LogReader(filename) as reader:
+            assert reader.overview_factors == [10, 100]
+            raw = reader.read()
+            for factor in (10, 100):
+                for start, stop in ((0, None), (15, 456), (1200, 1234)):
+                    overview = reader.read_overview(factor, ['posx', 'pulse_on'], start, stop)
+                    stop = num_rows if stop is None else stop
+                    block_list = range(start//factor, -(-stop//factor))
+                    for key, stats in overview.items():
+                        values = raw[key].astype(float)
+                        blocks = [values[i*factor:(i + 1)*factor] for i in block_list]
+                        numpy.testing.assert_allclose(stats['min'], [b.min() for b in blocks])
+                        numpy.testing.assert_allclose(stats['max'], [b.max() for b in blocks])
+                        numpy.testing.assert_allclose(stats['mean'], [b.mean() for b in blocks])